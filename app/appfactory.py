@@ -26,7 +26,15 @@ from flask_cors import CORS
 from .routes.status import status_bp, init_bp
 from .routes.tag import tag_bp
 from .routes.shelf import shelf_bp
+from .routes.metrics import metrics_bp
 from .models.dbbase import db
+from .probe import StatusProbe
+from .tagcache import TagCache
+from .collectioncache import MemoryCache
+from .metrics import Metrics, LATENCY_BUCKETS
+from .jsonprovider import CatalogJSONProvider
+from .ingest import IngestQueue
+from .compression import Compression
 
 
 def create_app(cfg):
@@ -39,6 +47,54 @@ def create_app(cfg):
     app.config.from_object(cfg)
     db.init_app(app)
 
+    # json encoding of the model responses
+    app.json = app.config.get('JSON_PROVIDER_CLASS', CatalogJSONProvider)(app)
+    app.json.iso_dates = app.config.get('JSON_ISO_DATES', False)
+    if not app.config.get('JSON_FAST_ENCODER', True):
+        app.json.fast = False
+
+    # database status snapshot served by /status
+    app.extensions['status_probe'] = \
+        StatusProbe(app, app.config.get('STATUS_PROBE_INTERVAL', 0))
+
+    # tag name/id resolution cache
+    app.extensions['tag_cache'] = TagCache(
+        app.config.get('TAG_CACHE_SIZE', 1024),
+        app.config.get('TAG_CACHE_TTL', 60))
+
+    # serialized collections read by GET /shelf/<id>
+    app.extensions['collection_cache'] = \
+        app.config.get('COLLECTION_CACHE_CLASS', MemoryCache)(
+            app.config.get('COLLECTION_CACHE_SIZE', 1024),
+            app.config.get('COLLECTION_CACHE_TTL', 300))
+
+    # storage statistics served by /shelf/stats for a window
+    app.extensions['shelf_stats_cache'] = \
+        MemoryCache(1, app.config.get('SHELF_STATS_CACHE_SECONDS', 60))
+
+    # queue for accept-then-process shelving, the workers of each process
+    # start with its first request
+    ingestQueue = app.extensions['ingest_queue'] = IngestQueue(
+        app, app.config.get('SHELF_INGEST_WORKERS', 0),
+        app.config.get('SHELF_INGEST_BATCH_SIZE', 100),
+        app.config.get('SHELF_INGEST_POLL_INTERVAL', 1.0),
+        app.config.get('SHELF_INGEST_STALE_AFTER', 300))
+    app.before_request(ingestQueue.start)
+
+    # optional request latency/query instrumentation served on /metrics
+    if app.config.get('METRICS_ENABLED', False):
+        app.extensions['metrics'] = \
+            Metrics(app, app.config.get('METRICS_LATENCY_BUCKETS',
+                                        LATENCY_BUCKETS))
+        app.register_blueprint(metrics_bp)
+
+    # gzip/brotli encoding of the responses for clients accepting it
+    if app.config.get('COMPRESSION_ENABLED', True):
+        app.extensions['compression'] = Compression(
+            app, app.config.get('COMPRESSION_ENCODINGS', ('br', 'gzip')),
+            app.config.get('COMPRESSION_MIN_SIZE', 500),
+            app.config.get('COMPRESSION_LEVEL', 6))
+
     # register the route blueprints
     app.register_blueprint(status_bp)
     app.register_blueprint(init_bp)
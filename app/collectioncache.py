@@ -0,0 +1,173 @@
+###############################################################################
+#  collectioncache.py for archivist card catalog microservice                 #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""
+Read-through cache of serialized collections
+"""
+# }}}
+
+# collectioncache {{{
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy import event, inspect
+from .models import db, Collection, Shelf
+
+
+def collectionKey(collectionid, edition):
+    """
+    Cache key of the serialized collection at the given current edition
+    """
+    return 'collection:{0}:{1}'.format(collectionid, edition)
+
+
+class CacheBackend(ABC):
+    """
+    Interface of the collection cache backends
+
+    Values are the dictionaries returned by Collection.serialize, a backend
+    living outside of the process (a Redis compatible store for instance)
+    encodes them itself, e.g. with app.json, and expires them after ttl
+    seconds.
+    """
+
+    @abstractmethod
+    def get(self, key):
+        """
+        Return the value stored under key or None
+        """
+
+    @abstractmethod
+    def set(self, key, value):
+        """
+        Store value under key
+        """
+
+    @abstractmethod
+    def delete(self, keys):
+        """
+        Drop the given keys
+        """
+
+    @abstractmethod
+    def clear(self):
+        """
+        Drop every entry
+        """
+
+    @abstractmethod
+    def stats(self):
+        """
+        Return the cache counters
+        """
+
+
+class MemoryCache(CacheBackend):
+    """
+    Bounded in process LRU cache whose entries expire after ttl seconds
+
+    Keyword arguments:
+    maxsize -- maximum number of entries kept
+    ttl -- seconds an entry is served for, 0 to keep entries until evicted
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl \
+               and entry[0] <= time.monotonic():
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self.lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+@event.listens_for(db.session, 'before_flush')
+def collectCollectionChanges(session, flush_context, instances):  # pylint: disable=unused-argument
+    """
+    Remember the cache keys of the collections and editions written by this
+    flush, under every current edition the collection had
+    """
+    keys = session.info.setdefault('collection_cache_keys', set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Collection):
+            history = inspect(obj).attrs.current_edition.history
+            keys.update(collectionKey(obj.collectionid, edition)
+                        for edition in history.sum() if edition is not None)
+        elif isinstance(obj, Shelf):
+            keys.add(collectionKey(obj.collectionid, obj.edition))
+
+
+@event.listens_for(db.session, 'after_commit')
+def invalidateCollectionChanges(session):
+    """
+    Drop the collections changed by the committed transaction from the cache
+    """
+    keys = session.info.pop('collection_cache_keys', None)
+    if keys:
+        current_app.extensions['collection_cache'].delete(keys)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discardCollectionChanges(session):
+    """
+    Forget the collection changes of a rolled back transaction
+    """
+    session.info.pop('collection_cache_keys', None)
+
+# }}}
@@ -0,0 +1,166 @@
+###############################################################################
+#  compression.py for archivist card catalog microservice                     #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""
+Response compression negotiated from Accept-Encoding
+"""
+# }}}
+
+# compression {{{
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson',
+                          'text/plain', 'text/html', 'text/csv')
+
+
+class GzipCompressor:
+    """
+    Incremental gzip compressor
+
+    Keyword arguments:
+    level -- zlib compression level, 1 (fastest) to 9 (smallest)
+    """
+
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                           16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        """
+        Compress data, returning whatever output is ready
+        """
+        return self.compressor.compress(data)
+
+    def flush(self):
+        """
+        Return the rest of the output
+        """
+        return self.compressor.flush()
+
+
+class BrotliCompressor:
+    """
+    Incremental brotli compressor
+
+    Keyword arguments:
+    level -- zlib style compression level, mapped onto brotli's 0 to 11
+    """
+
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=min(level, 11))
+
+    def compress(self, data):
+        """
+        Compress data, returning whatever output is ready
+        """
+        return self.compressor.process(data)
+
+    def flush(self):
+        """
+        Return the rest of the output
+        """
+        return self.compressor.finish()
+
+
+COMPRESSORS = {'gzip': GzipCompressor}
+if brotli is not None:
+    COMPRESSORS['br'] = BrotliCompressor
+
+
+class Compression:
+    """
+    Compress responses with the best encoding the client accepts
+
+    Buffered responses are compressed once they reach minSize bytes,
+    streamed responses are compressed chunk by chunk as they are sent
+    without knowing their size up front.
+
+    Keyword arguments:
+    app -- flask application whose responses are compressed
+    encodings -- content codings in order of preference, the ones whose
+                 module is not installed are skipped
+    minSize -- smallest buffered body in bytes worth compressing
+    level -- compression level
+    mimetypes -- response mimetypes to compress
+    """
+
+    def __init__(self, app, encodings=('br', 'gzip'), minSize=500, level=6,
+                 mimetypes=COMPRESSIBLE_MIMETYPES):
+        self.encodings = [e for e in encodings if e in COMPRESSORS]
+        self.minSize = minSize
+        self.level = level
+        self.mimetypes = set(mimetypes)
+
+        app.after_request(self.afterRequest)
+
+    def afterRequest(self, response):
+        """
+        Compress the response if the client and the response allow it
+        """
+        if response.mimetype not in self.mimetypes or \
+           response.status_code < 200 or response.status_code in (204, 304) \
+           or response.direct_passthrough or \
+           'Content-Encoding' in response.headers:
+            return response
+
+        # caches have to keep one copy per encoding
+        response.vary.add('Accept-Encoding')
+
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self.compressStream(
+                response.response, COMPRESSORS[encoding](self.level),
+                response.charset)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.minSize:
+                return response
+            compressor = COMPRESSORS[encoding](self.level)
+            response.set_data(compressor.compress(data) + compressor.flush())
+
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    @staticmethod
+    def compressStream(chunks, compressor, charset):
+        """
+        Generate the compressed body of a streamed response, closing the
+        original stream when done
+        """
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode(charset)
+                data = compressor.compress(chunk)
+                if data:
+                    yield data
+            yield compressor.flush()
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+# }}}
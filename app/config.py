@@ -22,6 +22,10 @@ Configuration information for the archivist card catalog microservice
 
 
 # config ## {{{
+import os
+from sqlalchemy.engine import URL
+
+
 class AppConfig:  # pylint: disable=too-few-public-methods
     """
     Application Configuration
@@ -31,6 +35,41 @@ class AppConfig:  # pylint: disable=too-few-public-methods
     ENVIRONMENT = "DEV"
     SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
     SQLALCHEMY_TRACK_MODFICITIONS = False
+    SQLALCHEMY_BINDS = {"queue": "sqlite:///ingest-queue.db"}
+    SHELF_BULK_CHUNK_SIZE = 500
+    SHELF_BULK_MAX_RECORDS = 10000
+    SHELF_EDITION_PAGE_SIZE = 100
+    SHELF_EDITION_MAX_PAGE_SIZE = 1000
+    SHELF_EXPORT_BATCH_SIZE = 1000
+    SHELF_SEARCH_PAGE_SIZE = 100
+    SHELF_SEARCH_MAX_PAGE_SIZE = 1000
+    SHELF_CHECKSUM_LOOKUP_MAX = 1000
+    SHELF_BATCH_MAX = 1000
+    SHELF_STATS_CACHE_SECONDS = 60
+    MIGRATION_BATCH_SIZE = 1000
+    SHELF_EDITION_RETRIES = 3
+    SHELF_ASYNC_INGEST = False
+    SHELF_INGEST_WORKERS = 0
+    SHELF_INGEST_BATCH_SIZE = 100
+    SHELF_INGEST_POLL_INTERVAL = 1.0
+    SHELF_INGEST_STALE_AFTER = 300
+    STATUS_PROBE_INTERVAL = 0
+    TAG_CACHE_SIZE = 1024
+    TAG_CACHE_TTL = 60
+    TAG_ASSIGN_CHUNK_SIZE = 1000
+    TAG_ASSIGN_RETRIES = 3
+    TAG_ASSIGN_MAX_IDS = 100000
+    TAG_PAGE_SIZE = 100
+    TAG_MAX_PAGE_SIZE = 1000
+    COLLECTION_CACHE_SIZE = 1024
+    COLLECTION_CACHE_TTL = 300
+    METRICS_ENABLED = False
+    JSON_FAST_ENCODER = True
+    JSON_ISO_DATES = False
+    COMPRESSION_ENABLED = True
+    COMPRESSION_ENCODINGS = ('br', 'gzip')
+    COMPRESSION_MIN_SIZE = 500
+    COMPRESSION_LEVEL = 6
 
 
 class DevConfig(AppConfig):  # pylint: disable=too-few-public-methods
@@ -44,8 +83,70 @@ class DevConfig(AppConfig):  # pylint: disable=too-few-public-methods
     SQLALCHEMY_TRACK_MODFICITIONS = False
 
 
+class ProdConfig(AppConfig):  # pylint: disable=too-few-public-methods
+    """
+    Production Configuration
+
+    The database connection and pool sizing are read from the environment
+    when the configuration is created:
+
+    DBEngine -- sqlalchemy driver name (default mysql+mysqldb)
+    DBHost, DBPort, DBName, DBUser, DBPasswd -- database location/credentials
+    DBPoolSize -- connections kept open per worker (default 10)
+    DBMaxOverflow -- extra connections allowed during bursts (default 20)
+    DBPoolTimeout -- seconds to wait for a free connection (default 30)
+    DBPoolRecycle -- seconds before a connection is replaced, kept below
+                     the server wait_timeout (default 280)
+    StatusProbeInterval -- seconds between background status probes
+                           (default 15)
+    MetricsEnabled -- serve request/query metrics on /metrics (default 1)
+    IngestQueueDatabase -- sqlalchemy url of the local ingest queue
+                           (default sqlite:///ingest-queue.db in the
+                           instance folder)
+    AsyncIngest -- queue shelving requests by default (default 0)
+    IngestWorkers -- ingest worker threads per process (default 2)
+    """
+    DEBUG = False
+    TESTING = False
+    ENVIRONMENT = "PROD"
+    SQLALCHEMY_TRACK_MODFICITIONS = False
+
+    def __init__(self):
+        port = os.environ.get('DBPort')
+        self.SQLALCHEMY_DATABASE_URI = URL.create(  # pylint: disable=invalid-name
+            drivername=os.environ.get('DBEngine', 'mysql+mysqldb'),
+            username=os.environ.get('DBUser'),
+            password=os.environ.get('DBPasswd'),
+            host=os.environ.get('DBHost', 'localhost'),
+            port=int(port) if port else None,
+            database=os.environ.get('DBName', 'card-catalog'))
+
+        self.SQLALCHEMY_ENGINE_OPTIONS = {  # pylint: disable=invalid-name
+            "pool_size": int(os.environ.get('DBPoolSize', 10)),
+            "max_overflow": int(os.environ.get('DBMaxOverflow', 20)),
+            "pool_timeout": int(os.environ.get('DBPoolTimeout', 30)),
+            "pool_recycle": int(os.environ.get('DBPoolRecycle', 280)),
+            "pool_pre_ping": True
+        }
+
+        self.STATUS_PROBE_INTERVAL = int(  # pylint: disable=invalid-name
+            os.environ.get('StatusProbeInterval', 15))
+        self.METRICS_ENABLED = os.environ.get(  # pylint: disable=invalid-name
+            'MetricsEnabled', '1') in ('1', 'true', 'yes')
+
+        self.SQLALCHEMY_BINDS = {  # pylint: disable=invalid-name
+            "queue": os.environ.get('IngestQueueDatabase',
+                                    'sqlite:///ingest-queue.db')
+        }
+        self.SHELF_ASYNC_INGEST = os.environ.get(  # pylint: disable=invalid-name
+            'AsyncIngest', '0') in ('1', 'true', 'yes')
+        self.SHELF_INGEST_WORKERS = int(  # pylint: disable=invalid-name
+            os.environ.get('IngestWorkers', 2))
+
+
 Configs = {
-    "DEV": DevConfig
+    "DEV": DevConfig,
+    "PROD": ProdConfig
 }
 
 # }}}
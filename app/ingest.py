@@ -0,0 +1,252 @@
+###############################################################################
+#  ingest.py for archivist card catalog microservice                          #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""
+Durable ingest queue drained by a pool of shelving workers
+"""
+# }}}
+
+# ingest {{{
+import datetime
+import json
+import threading
+import uuid
+from .models import db, IngestJob, JobState
+from .routes.shelf import shelveChunk, shelveEdition, shelfRecordData
+
+
+class IngestQueue:
+    """
+    Accept-then-process queue for shelving requests
+
+    Validated record data is written to the IngestJob table of the queue
+    bind and shelved later by worker threads in batches. New collections of
+    a batch are shelved in a single transaction, new editions one at a time
+    since each locks its collection. The outcome of each transaction is
+    recorded as soon as it commits. Jobs are processed at least once, a
+    job left processing by a worker that died is picked up again after
+    staleAfter seconds.
+
+    Keyword arguments:
+    app -- flask application the workers shelve into
+    workers -- number of worker threads, 0 leaves the queue to drain()
+    batchSize -- jobs claimed by a worker at a time
+    pollInterval -- seconds an idle worker waits before looking again
+    staleAfter -- seconds before a processing job is considered abandoned
+    """
+
+    def __init__(self, app, workers=0, batchSize=100,  # pylint: disable=too-many-arguments
+                 pollInterval=1.0, staleAfter=300):
+        self.app = app
+        self.workers = workers
+        self.batchSize = batchSize
+        self.pollInterval = pollInterval
+        self.staleAfter = staleAfter
+        self.threads = []
+        self.lock = threading.Lock()
+        self.ready = False
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+
+    def ensureTable(self):
+        """
+        Create the job table in the queue database if it is missing
+        """
+        if self.ready:
+            return
+
+        with self.lock:
+            if not self.ready:
+                IngestJob.__table__.create(db.engines['queue'],
+                                           checkfirst=True)
+                self.ready = True
+
+    def enqueue(self, payload, collectionid=None):
+        """
+        Queue validated record data as a new collection, or as a new edition
+        of collectionid, and return the job id
+        """
+        self.ensureTable()
+
+        job = IngestJob(payload=json.dumps(payload),
+                        collectionid=collectionid,
+                        state=JobState.QUEUED.value)
+        db.session.add(job)
+        db.session.commit()
+
+        self.start()
+        self.wakeup.set()
+        return job.jobid
+
+    def claim(self):
+        """
+        Mark up to batchSize queued or abandoned jobs as processing by a new
+        worker token and return them
+        """
+        stale = datetime.datetime.utcnow() - \
+            datetime.timedelta(seconds=self.staleAfter)
+        claimable = db.or_(IngestJob.state == JobState.QUEUED.value,
+                           db.and_(IngestJob.state ==
+                                   JobState.PROCESSING.value,
+                                   IngestJob.modified_date < stale))
+
+        jobids = [jobid for (jobid,) in
+                  db.session.query(IngestJob.jobid).filter(claimable)
+                            .order_by(IngestJob.jobid)
+                            .limit(self.batchSize)]
+        if not jobids:
+            db.session.rollback()
+            return []
+
+        # only jobs still claimable when the update runs are taken, another
+        # worker may have raced us to some of them
+        token = uuid.uuid4().hex
+        db.session.execute(
+            db.update(IngestJob)
+              .where(IngestJob.jobid.in_(jobids), claimable)
+              .values(state=JobState.PROCESSING.value, worker=token,
+                      modified_date=db.func.now())
+              .execution_options(synchronize_session=False))
+        db.session.commit()
+
+        return IngestJob.query.filter_by(worker=token,
+                                         state=JobState.PROCESSING.value) \
+                              .order_by(IngestJob.jobid).all()
+
+    @staticmethod
+    def outcome(job, state, collectionid=None, edition=None, error=None):
+        """
+        Values recording how a job ended, every outcome sets the same columns
+        so a batch of them is written with a single executemany
+        """
+        return {
+            'jobid': job.jobid,
+            'state': state,
+            'result_collectionid': collectionid,
+            'result_edition': edition,
+            'error': error
+        }
+
+    def finish(self, outcomes):
+        """
+        Record the outcomes of jobs in one transaction
+        """
+        if outcomes:
+            db.session.bulk_update_mappings(IngestJob, outcomes)
+        db.session.commit()
+
+    def process(self, jobs):
+        """
+        Shelve the records of the claimed jobs and record their outcomes
+        """
+        payloads = {job.jobid: json.loads(job.payload) for job in jobs}
+        collections = [job for job in jobs if job.collectionid is None]
+        editions = [job for job in jobs if job.collectionid is not None]
+
+        if collections:
+            self.finish(self.shelveCollections(collections, payloads))
+
+        # each edition commits on its own, record it before the next one so
+        # a reclaimed batch does not shelve it again
+        for job in editions:
+            shelved, res = shelveEdition(
+                job.collectionid, shelfRecordData(payloads[job.jobid]))
+            if shelved:
+                self.finish([self.outcome(job, JobState.DONE.value,
+                                          res.collectionid, res.edition)])
+            else:
+                self.finish([self.outcome(job, JobState.FAILED.value,
+                                          error=res['ErrMsg'])])
+
+    def shelveCollections(self, jobs, payloads):
+        """
+        Shelve the new collections of jobs as one chunk, falling back to one
+        at a time so that a bad record only fails its own job
+
+        Returns the outcomes of the jobs
+        """
+        try:
+            ids = shelveChunk([payloads[job.jobid] for job in jobs])
+        except Exception as err:  # pylint: disable=broad-except
+            db.session.rollback()
+            if len(jobs) == 1:
+                return [self.outcome(jobs[0], JobState.FAILED.value,
+                                     error=str(err))]
+            return [outcome for job in jobs
+                    for outcome in self.shelveCollections([job], payloads)]
+
+        return [self.outcome(job, JobState.DONE.value, collectionid, 1)
+                for job, collectionid in zip(jobs, ids)]
+
+    def drain(self):
+        """
+        Process jobs until the queue is empty, returning how many were
+        processed. Must be called inside an application context.
+        """
+        self.ensureTable()
+
+        processed = 0
+        while True:
+            jobs = self.claim()
+            if not jobs:
+                return processed
+            self.process(jobs)
+            processed += len(jobs)
+
+    def start(self):
+        """
+        Start the worker threads if they are enabled and not running
+        """
+        if self.workers <= 0 or self.threads:
+            return
+
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self.run,
+                                          name=f'ingest-worker-{i}',
+                                          daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def stop(self):
+        """
+        Stop the worker threads
+        """
+        self.stopped.set()
+        self.wakeup.set()
+
+    def run(self):
+        """
+        Worker loop
+        """
+        while not self.stopped.is_set():
+            with self.app.app_context():
+                try:
+                    processed = self.drain()
+                except Exception:  # pylint: disable=broad-except
+                    db.session.rollback()
+                    processed = 0
+                finally:
+                    db.session.remove()
+
+            if not processed:
+                self.wakeup.wait(self.pollInterval)
+                self.wakeup.clear()
+
+# }}}
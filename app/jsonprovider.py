@@ -0,0 +1,99 @@
+###############################################################################
+#  jsonprovider.py for archivist card catalog microservice                    #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""
+JSON provider backed by orjson when it is installed
+"""
+# }}}
+
+# jsonprovider {{{
+import datetime
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def isoDefault(obj):
+    """
+    Write dates as ISO 8601, everything else as the default provider does
+    """
+    if isinstance(obj, (datetime.date, datetime.datetime)):
+        return obj.isoformat()
+    return DefaultJSONProvider.default(obj)
+
+
+class CatalogJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that encodes with orjson when it is available and
+    falls back to the stdlib json module of the default provider otherwise
+
+    Datetimes are written as http dates, the same as the default provider,
+    unless iso_dates is set in which case orjson writes them natively as
+    ISO 8601.
+    """
+    fast = orjson is not None
+    iso_dates = False
+
+    def options(self, indent=False):
+        """
+        orjson options matching the provider settings
+        """
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if not self.iso_dates:
+            option |= orjson.OPT_PASSTHROUGH_DATETIME
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def encode(self, obj, indent=False):
+        """
+        Serialize obj to utf-8 json bytes
+        """
+        if self.fast:
+            return orjson.dumps(obj, default=self.default,
+                                option=self.options(indent))
+
+        return self.dumps(obj, indent=2 if indent else None).encode()
+
+    def dumps(self, obj, **kwargs):
+        if self.fast and not kwargs:
+            return self.encode(obj).decode()
+
+        if self.iso_dates:
+            kwargs.setdefault('default', isoDefault)
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if self.fast and not kwargs:
+            return orjson.loads(s)
+
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or \
+            (self.compact is None and self._app.debug)
+
+        return self._app.response_class(self.encode(obj, indent) + b'\n',
+                                        mimetype=self.mimetype)
+
+# }}}
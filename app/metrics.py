@@ -0,0 +1,219 @@
+###############################################################################
+#  metrics.py for archivist card catalog microservice                         #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""
+Request latency and query count instrumentation
+"""
+# }}}
+
+# metrics {{{
+import threading
+import time
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from .models import db
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:  # pylint: disable=too-few-public-methods
+    """
+    Cumulative histogram in the prometheus sense
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        Record a single observation
+        """
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        """
+        Return the prometheus text lines of the histogram
+        """
+        lines = [f'{name}_bucket{{{labels},le="{bound}"}} {count}'
+                 for bound, count in zip(self.buckets, self.counts)]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class Metrics:
+    """
+    Per endpoint latency, query count and query time collected from
+    request hooks and sqlalchemy cursor events
+
+    Keyword arguments:
+    app -- flask application to instrument
+    latencyBuckets -- upper bounds in seconds of the latency histogram
+    """
+
+    def __init__(self, app, latencyBuckets=LATENCY_BUCKETS):
+        self.latencyBuckets = tuple(latencyBuckets)
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+        app.before_request(self.beforeRequest)
+        app.after_request(self.afterRequest)
+        app.teardown_request(self.teardownRequest)
+
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute',
+                             self.beforeCursorExecute)
+                event.listen(engine, 'after_cursor_execute',
+                             self.afterCursorExecute)
+                event.listen(engine, 'handle_error', self.handleError)
+
+    def beforeRequest(self):
+        """
+        Start timing the request
+        """
+        g.metrics = {
+            'start': time.perf_counter(),
+            'queries': 0,
+            'query_time': 0.0,
+            'streamed': False
+        }
+
+    def afterRequest(self, response):
+        """
+        Record the request latency and its queries against its endpoint,
+        a streamed response once its body has been sent so the queries run
+        while generating it are counted and the latency is to the last byte
+        """
+        requestMetrics = g.get('metrics')
+        if requestMetrics is None:
+            return response
+
+        key = (request.endpoint or 'unmatched', request.method)
+        if response.is_streamed:
+            requestMetrics['streamed'] = True
+            response.call_on_close(
+                lambda: self.record(key, requestMetrics))
+        else:
+            g.pop('metrics')
+            self.record(key, requestMetrics)
+
+        return response
+
+    def teardownRequest(self, exc):  # pylint: disable=unused-argument
+        """
+        Record a request that ended in an unhandled exception, flask skips
+        the after request hooks for those. Streamed responses are recorded
+        when they close.
+        """
+        requestMetrics = g.pop('metrics', None)
+        if requestMetrics is not None and not requestMetrics['streamed']:
+            self.record((request.endpoint or 'unmatched', request.method),
+                        requestMetrics)
+
+    def record(self, key, requestMetrics):
+        """
+        Add a finished request to the histograms of its endpoint
+        """
+        latency = time.perf_counter() - requestMetrics['start']
+        with self.lock:
+            endpoint = self.endpoints.get(key)
+            if endpoint is None:
+                endpoint = self.endpoints[key] = {
+                    'latency': Histogram(self.latencyBuckets),
+                    'queries': Histogram(QUERY_BUCKETS),
+                    'query_time': 0.0
+                }
+            endpoint['latency'].observe(latency)
+            endpoint['queries'].observe(requestMetrics['queries'])
+            endpoint['query_time'] += requestMetrics['query_time']
+
+    def beforeCursorExecute(self, conn, cursor, statement, parameters,  # pylint: disable=too-many-arguments
+                            context, executemany):  # pylint: disable=unused-argument
+        """
+        Note when the statement started on its execution context, which
+        lives only as long as the statement
+        """
+        if context is not None:
+            context.metrics_query_start = time.perf_counter()
+
+    def afterCursorExecute(self, conn, cursor, statement, parameters,  # pylint: disable=too-many-arguments
+                           context, executemany):  # pylint: disable=unused-argument
+        """
+        Add the statement to the current request
+        """
+        self.countStatement(context)
+
+    def handleError(self, exceptionContext):
+        """
+        Add a statement that raised to the current request
+        """
+        self.countStatement(exceptionContext.execution_context)
+
+    def countStatement(self, context):
+        """
+        Add the time since the statement of context started to the current
+        request, statements issued outside of a request (e.g. the status
+        probe) are not counted
+        """
+        start = getattr(context, 'metrics_query_start', None)
+        if start is None or not has_request_context():
+            return
+        elapsed = time.perf_counter() - start
+
+        requestMetrics = g.get('metrics')
+        if requestMetrics is not None:
+            requestMetrics['queries'] += 1
+            requestMetrics['query_time'] += elapsed
+
+    def render(self):
+        """
+        Return the collected metrics in the prometheus text format
+        """
+        latency = ['# HELP catalog_request_duration_seconds '
+                   'Request latency by endpoint',
+                   '# TYPE catalog_request_duration_seconds histogram']
+        queries = ['# HELP catalog_request_queries '
+                   'SQL statements issued per request by endpoint',
+                   '# TYPE catalog_request_queries histogram']
+        queryTime = ['# HELP catalog_request_query_seconds_total '
+                     'Time spent in SQL statements by endpoint',
+                     '# TYPE catalog_request_query_seconds_total counter']
+
+        with self.lock:
+            for (endpoint, method), values in sorted(self.endpoints.items()):
+                labels = f'endpoint="{endpoint}",method="{method}"'
+                latency.extend(values['latency'].lines(
+                    'catalog_request_duration_seconds', labels))
+                queries.extend(values['queries'].lines(
+                    'catalog_request_queries', labels))
+                queryTime.append(f'catalog_request_query_seconds_total'
+                                 f'{{{labels}}} {values["query_time"]}')
+
+        return '\n'.join(latency + queries + queryTime) + '\n'
+
+# }}}
@@ -0,0 +1,290 @@
+###############################################################################
+#  migrations.py for archivist card catalog microservice                      #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""
+Versioned schema migrations
+
+Every release that changes the schema appends a Migration taking the
+database from the previous version to its own, app/version.py names the
+newest one. The applied versions are recorded as card_catalog rows so an
+interrupted upgrade resumes from the last finished migration. Steps check
+the schema before changing it and large data changes are committed in
+batches, on mysql indexes and columns are added with online DDL.
+"""
+# }}}
+
+# migrations {{{
+from sqlalchemy import inspect
+from .models import db, CardCatalog, Shelf, Tag
+from .models.shelf import SHELF_FTS_DDL, backfill_size_bytes
+from .models.tags import collectionXtag
+from .version import VERSION, APPNAME
+
+# version of the schema created before migrations existed
+BASELINE = '0.1'
+
+
+def versionKey(version):
+    """
+    Sortable key of a dotted version string
+    """
+    return tuple(int(part) for part in version.split('.'))
+
+
+class Migration:  # pylint: disable=too-few-public-methods
+    """
+    Schema change taking the database to version
+
+    Keyword arguments:
+    version -- version of the schema once applied
+    description -- what the migration changes
+    steps -- callables applied in order, each given the batch size and
+             committed on its own
+    """
+
+    def __init__(self, version, description, steps):
+        self.version = version
+        self.description = description
+        self.steps = steps
+
+    def apply(self, batchSize):
+        """
+        Apply every step of the migration
+        """
+        for step in self.steps:
+            step(batchSize)
+            db.session.commit()
+
+
+def createIndex(table, name):
+    """
+    Step creating the index the models declare on table under name if the
+    database does not have it yet
+    """
+    def step(batchSize):  # pylint: disable=unused-argument
+        conn = db.session.connection()
+        if name in {index['name']
+                    for index in inspect(conn).get_indexes(table.name)}:
+            return
+
+        index = next(index for index in table.indexes if index.name == name)
+        if conn.dialect.name == 'mysql':
+            # build the index in place without blocking writes
+            quote = conn.dialect.identifier_preparer.quote
+            conn.exec_driver_sql(
+                'ALTER TABLE {0} ADD {1}INDEX {2} ({3}), '
+                'ALGORITHM=INPLACE, LOCK=NONE'.format(
+                    quote(table.name), 'UNIQUE ' if index.unique else '',
+                    quote(name),
+                    ', '.join(quote(column.name)
+                              for column in index.columns)))
+        else:
+            index.create(bind=conn)
+
+    return step
+
+
+def addColumn(table, name):
+    """
+    Step adding the column the models declare on table under name if the
+    database does not have it yet, a column that is not nullable needs a
+    server default to fill the existing rows
+    """
+    def step(batchSize):  # pylint: disable=unused-argument
+        conn = db.session.connection()
+        if name in {column['name']
+                    for column in inspect(conn).get_columns(table.name)}:
+            return
+
+        quote = conn.dialect.identifier_preparer.quote
+        column = table.c[name]
+        ddl = 'ALTER TABLE {0} ADD COLUMN {1} {2}'.format(
+            quote(table.name), quote(name),
+            column.type.compile(dialect=conn.dialect))
+        if column.server_default is not None:
+            ddl += ' NOT NULL' if not column.nullable else ''
+            ddl += ' DEFAULT {0}'.format(column.server_default.arg)
+        if conn.dialect.name == 'mysql':
+            ddl += ', ALGORITHM=INPLACE, LOCK=NONE'
+        conn.exec_driver_sql(ddl)
+
+    return step
+
+
+def dedupeCollectionTags(batchSize):
+    """
+    Collapse repeated (tagid, collectionid) pairs so the pair can become the
+    collectionXTag key, batchSize pairs per transaction
+    """
+    table = collectionXtag
+    while True:
+        pairs = db.session.execute(
+            db.select(table.c.tagid, table.c.collectionid)
+              .group_by(table.c.tagid, table.c.collectionid)
+              .having(db.func.count() > 1).limit(batchSize)).all()
+        if not pairs:
+            return
+
+        for pair in pairs:
+            db.session.execute(table.delete().where(
+                table.c.tagid == pair.tagid,
+                table.c.collectionid == pair.collectionid))
+        db.session.execute(table.insert(),
+                           [{'tagid': pair.tagid,
+                             'collectionid': pair.collectionid}
+                            for pair in pairs])
+        db.session.commit()
+
+
+def collectionTagKey(batchSize):  # pylint: disable=unused-argument
+    """
+    Make (tagid, collectionid) the collectionXTag primary key, sqlite can
+    not add a key to an existing table so it keeps its rowid
+    """
+    conn = db.session.connection()
+    if conn.dialect.name != 'mysql' or \
+       inspect(conn).get_pk_constraint(collectionXtag.name) \
+                    .get('constrained_columns'):
+        return
+
+    conn.exec_driver_sql('ALTER TABLE `collectionXTag` '
+                         'ADD PRIMARY KEY (tagid, collectionid)')
+
+
+def fullTextIndex(batchSize):  # pylint: disable=unused-argument
+    """
+    Create the shelf full-text index and index the existing records
+    """
+    conn = db.session.connection()
+    dialect = conn.dialect.name
+    inspector = inspect(conn)
+    if dialect == 'sqlite' and inspector.has_table('shelf_fts'):
+        return
+    if dialect == 'mysql' and 'ix_shelf_fulltext' in \
+       {index['name'] for index in inspector.get_indexes('shelf')}:
+        return
+
+    for statement in SHELF_FTS_DDL.get(dialect, []):
+        conn.exec_driver_sql(statement)
+    if dialect == 'sqlite':
+        conn.exec_driver_sql("INSERT INTO shelf_fts(shelf_fts) "
+                             "VALUES ('rebuild')")
+
+
+def backfillSizes(batchSize):
+    """
+    Fill size_bytes of the existing records
+    """
+    backfill_size_bytes(batchSize)
+
+
+def countTagCollections(batchSize):
+    """
+    Set the collection_count of the existing tags from their collectionXTag
+    rows, batchSize tags per transaction
+    """
+    counts = db.select(db.func.count()) \
+               .select_from(collectionXtag) \
+               .where(collectionXtag.c.tagid == Tag.tagid).scalar_subquery()
+    lastTag = 0
+    while True:
+        tagids = db.session.execute(
+            db.select(Tag.tagid).where(Tag.tagid > lastTag)
+              .order_by(Tag.tagid).limit(batchSize)).scalars().all()
+        if not tagids:
+            return
+
+        db.session.execute(
+            db.update(Tag).where(Tag.tagid.in_(tagids))
+              .values(collection_count=counts)
+              .execution_options(synchronize_session=False))
+        db.session.commit()
+        lastTag = tagids[-1]
+
+
+MIGRATIONS = [
+    Migration('0.2', 'Indexes for edition, checksum and tag reads',
+              [createIndex(Shelf.__table__, 'ix_shelf_collectionid_edition'),
+               createIndex(Shelf.__table__, 'ix_shelf_checksum'),
+               createIndex(Tag.__table__, 'ix_tag_name'),
+               dedupeCollectionTags,
+               collectionTagKey,
+               createIndex(collectionXtag, 'ix_collectionXTag_collectionid')]),
+    Migration('0.3', 'Full-text index over shelf records',
+              [fullTextIndex]),
+    Migration('0.4', 'Record sizes in bytes',
+              [addColumn(Shelf.__table__, 'size_bytes'),
+               backfillSizes,
+               createIndex(Shelf.__table__, 'ix_shelf_size_bytes'),
+               createIndex(Shelf.__table__, 'ix_shelf_record_type_size'),
+               createIndex(Shelf.__table__, 'ix_shelf_extension_size'),
+               createIndex(Shelf.__table__, 'ix_shelf_creation_user_size')]),
+    Migration('0.5', 'Collection counts of the tags',
+              [addColumn(Tag.__table__, 'collection_count'),
+               countTagCollections,
+               createIndex(Tag.__table__, 'ix_tag_collection_count')])
+]
+
+
+def installedVersion():
+    """
+    Return the newest catalog version recorded in the database, the
+    baseline if the catalog tables predate the version record and None if
+    the database is empty
+    """
+    inspector = inspect(db.session.connection())
+    if inspector.has_table(CardCatalog.__tablename__):
+        rec = CardCatalog.query.order_by(CardCatalog.id.desc()).first()
+        if rec is not None:
+            return rec.version
+
+    if inspector.has_table(Shelf.__tablename__):
+        return BASELINE
+
+    return None
+
+
+def migrate(installed, batchSize=1000):
+    """
+    Bring the database from the installed version (None for an empty
+    database) to VERSION
+
+    Returns the versions of the migrations applied
+    """
+    if installed is None:
+        # an empty database gets the current schema in one go
+        db.create_all()
+        db.session.add(CardCatalog(name=APPNAME, version=VERSION))
+        db.session.commit()
+        return []
+
+    # tables new since the installed version
+    db.create_all()
+
+    applied = []
+    for migration in MIGRATIONS:
+        if versionKey(migration.version) <= versionKey(installed) or \
+           versionKey(migration.version) > versionKey(VERSION):
+            continue
+        migration.apply(batchSize)
+        db.session.add(CardCatalog(name=APPNAME, version=migration.version))
+        db.session.commit()
+        applied.append(migration.version)
+
+    return applied
+
+# }}}
@@ -26,6 +26,8 @@ from .shelf import Shelf, RecordType
 from .dbbase import db
 from .collection import Collection
 from .tags import Tag
+from .ingest_job import IngestJob, JobState
 
-__all__ = ['CardCatalog', 'Shelf', 'RecordType', 'db', 'Collection', 'Tag']
+__all__ = ['CardCatalog', 'Shelf', 'RecordType', 'db', 'Collection', 'Tag',
+           'IngestJob', 'JobState']
 # }}}
@@ -21,9 +21,15 @@ ollection of editions of records
 # }}}
 
 # collection{{{
+from collections import Counter
+from sqlalchemy import event, inspect
 from sqlalchemy.sql import func
 from .dbbase import db
-from .tags import collectionXtag
+from .tags import Tag, collectionXtag
+from .shelf import Shelf
+
+# marker for serialize to look the current edition up itself
+LOOKUP_EDITION = object()
 
 
 class Collection(db.Model):  # pylint: disable=too-few-public-methods
@@ -45,14 +51,24 @@ class Collection(db.Model):  # pylint: disable=too-few-public-methods
     tags = db.relationship('Tag', secondary=collectionXtag,
                            backref='collection')
 
-    def serialize(self):
+    def current_record(self):
         """
-        JSON of a collection
+        Fetch only the shelf record of the current edition
+        """
+        return Shelf.query.filter_by(collectionid=self.collectionid,
+                                     edition=self.current_edition).first()
+
+    def serialize(self, current_edition=LOOKUP_EDITION):
         """
+        JSON of a collection
 
-        current_edition = next(filter(lambda r:
-                                      r.edition == self.current_edition,
-                                      self.records), None)
+        Keyword arguments:
+        current_edition -- shelf record of the current edition (or None if
+                           it is missing), looked up by
+                           (collectionid, edition) when not supplied
+        """
+        if current_edition is LOOKUP_EDITION:
+            current_edition = self.current_record()
         serialize_edition = current_edition.serialize() if current_edition \
             else {}
 
@@ -65,4 +81,40 @@ class Collection(db.Model):  # pylint: disable=too-few-public-methods
             "modified_user": self.modified_user,
             "edition": serialize_edition
         }
+
+
+@event.listens_for(db.session, 'before_flush')
+def count_tag_changes(session, flush_context, instances):  # pylint: disable=unused-argument
+    """
+    Move the collection_count of the tags whose collections are changed
+    through the ORM relationships by the number of rows the flush adds to or
+    removes from collectionXTag
+    """
+    added = set()
+    removed = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Collection):
+            if obj in session.deleted:
+                removed.update((tag, obj) for tag in obj.tags)
+                continue
+            history = inspect(obj).attrs.tags.history
+            added.update((tag, obj) for tag in history.added or ())
+            removed.update((tag, obj) for tag in history.deleted or ())
+        elif isinstance(obj, Tag) and obj not in session.deleted:
+            # the backref records the same change on the tag side
+            history = inspect(obj).attrs.collection.history
+            added.update((obj, collection)
+                         for collection in history.added or ())
+            removed.update((obj, collection)
+                           for collection in history.deleted or ())
+
+    delta = Counter(tag for tag, _ in added - removed)
+    delta.subtract(tag for tag, _ in removed - added)
+    for tag, change in delta.items():
+        if change == 0 or tag in session.deleted:
+            continue
+        if tag in session.new:
+            tag.collection_count = (tag.collection_count or 0) + change
+        else:
+            tag.collection_count = Tag.collection_count + change
 # }}}
@@ -0,0 +1,74 @@
+###############################################################################
+#  ingest_job.py for archivist card catalog microservice models               #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""
+## ingest job model
+"""
+# }}}
+
+# ingest_job {{{
+from enum import Enum
+from sqlalchemy.sql import func
+from .dbbase import db
+
+
+class JobState(str, Enum):  # pylint: disable=too-few-public-methods
+    """
+    Ingest job states
+    """
+    QUEUED = 'queued'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
+class IngestJob(db.Model):  # pylint: disable=too-few-public-methods
+    """
+    Queued shelving request, kept in the local queue database
+    """
+    __bind_key__ = 'queue'
+    __table_args__ = (
+        db.Index('ix_ingest_job_state_jobid', 'state', 'jobid'),
+    )
+    jobid = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    state = db.Column(db.String(10), nullable=False,
+                      default=JobState.QUEUED.value)
+    collectionid = db.Column(db.Integer, nullable=True)
+    payload = db.Column(db.Text, nullable=False)
+    worker = db.Column(db.String(64), nullable=True)
+    result_collectionid = db.Column(db.Integer, nullable=True)
+    result_edition = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    creation_date = db.Column(db.DateTime, server_default=func.now())
+    modified_date = db.Column(db.DateTime, server_default=func.now(),
+                              onupdate=func.now())
+
+    def serialize(self):
+        """
+        Return the ingest job as a dictionary
+        """
+        return {
+            "jobid": self.jobid,
+            "state": self.state,
+            "collectionid": self.result_collectionid,
+            "edition": self.result_edition,
+            "error": self.error,
+            "creation_date": self.creation_date,
+            "modified_date": self.modified_date
+        }
+
+# }}}
@@ -21,16 +21,53 @@
 # }}}
 
 # shelf {{{
+import re
 from enum import IntEnum
+from sqlalchemy import DDL, event
 from sqlalchemy.sql import func
 from .dbbase import db
 
+SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3,
+              't': 1024 ** 4, 'p': 1024 ** 5}
+SIZE_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmgtp]?)i?b?\s*$',
+                          re.IGNORECASE)
+
+
+def parse_size(size):
+    """
+    Return the number of bytes of a record size given either as a number or
+    as a string such as "2048", "101kb" or "1.5 MiB", None if it can not be
+    read
+    """
+    if isinstance(size, int) and not isinstance(size, bool):
+        return size
+    match = SIZE_PATTERN.match(size) if isinstance(size, str) else None
+    if match is None:
+        return None
+    return round(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()])
+
+
+def default_size_bytes(context):
+    """
+    Insert default of size_bytes, parsed from the size of the same row
+    """
+    return parse_size(context.get_current_parameters().get('size'))
+
 
 class Shelf(db.Model):  # pylint: disable=too-few-public-methods
     """
     Shelf ORM
     """
-    __table_args__ = {"mysql_engine": "InnoDB"}
+    __table_args__ = (
+        db.Index('ix_shelf_collectionid_edition', 'collectionid', 'edition',
+                 unique=True),
+        # covering indexes for the storage statistics group bys
+        db.Index('ix_shelf_record_type_size', 'record_type', 'size_bytes'),
+        db.Index('ix_shelf_extension_size', 'extension', 'size_bytes'),
+        db.Index('ix_shelf_creation_user_size', 'creation_user',
+                 'size_bytes'),
+        {"mysql_engine": "InnoDB"}
+    )
     recordid = db.Column(db.Integer, primary_key=True)
     collectionid = db.Column(db.Integer,
                              db.ForeignKey('collection.collectionid'))
@@ -40,8 +77,10 @@ class Shelf(db.Model):  # pylint: disable=too-few-public-methods
     filename = db.Column(db.String(255), nullable=False)
     extension = db.Column(db.String(10), nullable=False)
     size = db.Column(db.String(100), nullable=False)
+    size_bytes = db.Column(db.BigInteger, default=default_size_bytes,
+                           index=True)
     author = db.Column(db.String(255), nullable=False)
-    checksum = db.Column(db.String(64), nullable=False)
+    checksum = db.Column(db.String(64), nullable=False, index=True)
     creation_date = db.Column(db.DateTime, server_default=func.now())
     creation_user = db.Column(db.Integer, nullable=False)
 
@@ -58,12 +97,99 @@ class Shelf(db.Model):  # pylint: disable=too-few-public-methods
             "filename": self.filename,
             "extension": self.extension,
             "size": self.size,
+            "size_bytes": self.size_bytes,
             "author": self.author,
             "checksum": self.checksum,
             "creation_date": self.creation_date,
             "creation_user": self.creation_user,
         }
 
+    @staticmethod
+    def serialize_row(row, fields=None):
+        """
+        Return a row selected from Shelf.__table__.c as a dictionary, the
+        same as serialize without building a Shelf object
+
+        Keyword arguments:
+        row -- result row containing the shelf columns
+        fields -- names of the columns to include, all of the row if None
+        """
+        mapping = row._mapping  # pylint: disable=protected-access
+        if fields is None:
+            return dict(mapping)
+        return {field: mapping[field] for field in fields}
+
+
+def backfill_size_bytes(batch_size=1000):
+    """
+    Fill size_bytes of the records shelved before the column existed, in
+    recordid order one committed batch at a time so the table is never
+    locked for long
+
+    Returns the number of records updated
+    """
+    table = Shelf.__table__
+    update = table.update() \
+                  .where(table.c.recordid == db.bindparam('_recordid')) \
+                  .values(size_bytes=db.bindparam('_size_bytes'))
+    lastRecord = 0
+    updated = 0
+
+    while True:
+        rows = db.session.execute(
+            db.select(table.c.recordid, table.c.size)
+              .where(table.c.recordid > lastRecord,
+                     table.c.size_bytes.is_(None))
+              .order_by(table.c.recordid).limit(batch_size)).all()
+        if not rows:
+            return updated
+
+        lastRecord = rows[-1].recordid
+        values = [{'_recordid': row.recordid,
+                   '_size_bytes': parse_size(row.size)}
+                  for row in rows if parse_size(row.size) is not None]
+        if values:
+            db.session.execute(update, values)
+            updated += len(values)
+        db.session.commit()
+
+
+# full-text index over title, author and filename, an external content FTS5
+# table kept in step by triggers on sqlite and a FULLTEXT index on mysql
+SHELF_FTS_COLUMNS = 'title, author, filename'
+SHELF_FTS_DDL = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE shelf_fts USING fts5("
+        f"{SHELF_FTS_COLUMNS}, content='shelf', content_rowid='recordid')",
+        "CREATE TRIGGER shelf_fts_insert AFTER INSERT ON shelf BEGIN "
+        f"INSERT INTO shelf_fts(rowid, {SHELF_FTS_COLUMNS}) "
+        "VALUES (new.recordid, new.title, new.author, new.filename); END",
+        "CREATE TRIGGER shelf_fts_delete AFTER DELETE ON shelf BEGIN "
+        f"INSERT INTO shelf_fts(shelf_fts, rowid, {SHELF_FTS_COLUMNS}) "
+        "VALUES ('delete', old.recordid, old.title, old.author, "
+        "old.filename); END",
+        f"CREATE TRIGGER shelf_fts_update AFTER UPDATE OF {SHELF_FTS_COLUMNS} "
+        "ON shelf BEGIN "
+        f"INSERT INTO shelf_fts(shelf_fts, rowid, {SHELF_FTS_COLUMNS}) "
+        "VALUES ('delete', old.recordid, old.title, old.author, "
+        "old.filename); "
+        f"INSERT INTO shelf_fts(rowid, {SHELF_FTS_COLUMNS}) "
+        "VALUES (new.recordid, new.title, new.author, new.filename); END"
+    ],
+    'mysql': [
+        "ALTER TABLE shelf ADD FULLTEXT INDEX ix_shelf_fulltext "
+        f"({SHELF_FTS_COLUMNS})"
+    ]
+}
+
+for dialect, statements in SHELF_FTS_DDL.items():
+    for statement in statements:
+        event.listen(Shelf.__table__, 'after_create',
+                     DDL(statement).execute_if(dialect=dialect))
+event.listen(Shelf.__table__, 'before_drop',
+             DDL('DROP TABLE IF EXISTS shelf_fts')
+             .execute_if(dialect='sqlite'))
+
 
 class RecordType(IntEnum):  # pylint: disable=too-few-public-methods
     """
@@ -30,9 +30,18 @@ class Tag(db.Model):  # pylint: disable=too-few-public-methods
     """
     Tag ORM
     """
-    __table_args__ = {"mysql_engine": "InnoDB"}
+    __table_args__ = (
+        # tags by popularity for the tag listing
+        db.Index('ix_tag_collection_count', 'collection_count', 'tagid'),
+        {"mysql_engine": "InnoDB"}
+    )
     tagid = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    name = db.Column(db.String(TAGLEN), nullable=False)
+    name = db.Column(db.String(TAGLEN), nullable=False, unique=True,
+                     index=True)
+    # number of collectionXTag rows of the tag, kept up to date by every
+    # writer of the association rather than counted on read
+    collection_count = db.Column(db.Integer, nullable=False, default=0,
+                                 server_default='0')
 
     def serialize(self):
         """
@@ -44,9 +53,14 @@ class Tag(db.Model):  # pylint: disable=too-few-public-methods
         }
 
 
+# the (tagid, collectionid) primary key serves tag -> collection lookups and
+# the collectionid index the reverse direction
 collectionXtag = db.Table('collectionXTag',
                           db.Column('tagid', db.Integer,
-                                    db.ForeignKey('tag.tagid')),
+                                    db.ForeignKey('tag.tagid'),
+                                    primary_key=True),
                           db.Column('collectionid', db.Integer,
-                                    db.ForeignKey('collection.collectionid')))
+                                    db.ForeignKey('collection.collectionid'),
+                                    primary_key=True, index=True),
+                          mysql_engine='InnoDB')
 # }}}
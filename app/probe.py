@@ -0,0 +1,139 @@
+###############################################################################
+#  probe.py for archivist card catalog microservice                           #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""
+Background database probe backing the status endpoint
+"""
+# }}}
+
+# probe {{{
+import datetime
+import threading
+from flask import current_app, has_app_context
+from sqlalchemy import desc
+from .models import db, CardCatalog
+
+
+class StatusProbe:
+    """
+    Keeps a snapshot of the database status so that status requests can be
+    answered without touching the database
+
+    Keyword arguments:
+    app -- flask application the probe queries the database for
+    interval -- seconds between background refreshes, 0 disables the
+                background thread and the snapshot is only refreshed on
+                demand
+    """
+
+    def __init__(self, app, interval=0):
+        self.app = app
+        self.interval = interval
+        self.snapshot = None
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def probe(self):
+        """
+        Query the database for the installed catalog version
+        """
+        dbInfo = {}
+
+        try:
+            rec = CardCatalog.query.order_by(desc(CardCatalog.id)).first()
+            if rec is None:
+                dbInfo['status'] = 'Uninitialized'
+                dbInfo['errMsg'] = 'Application version not found'
+            else:
+                dbInfo['status'] = 'Initialized'
+                dbInfo = {**dbInfo, **(rec.serialize())}
+
+        except Exception as err:  # pylint: disable=broad-except
+            dbInfo['status'] = 'Uninitialized'
+            dbInfo['errMsg'] = \
+                'Error retrieving application version: "{0}"'.format(err)
+
+        return dbInfo
+
+    def refresh(self):
+        """
+        Probe the database and replace the snapshot
+        """
+        # reuse the session of the calling request if there is one
+        app = current_app._get_current_object() \
+            if has_app_context() else None  # pylint: disable=protected-access
+        if app is self.app:
+            dbInfo = self.probe()
+        else:
+            with self.app.app_context():
+                dbInfo = self.probe()
+                db.session.remove()
+
+        snapshot = {
+            'database': dbInfo,
+            'checked': datetime.datetime.utcnow()
+        }
+        with self.lock:
+            self.snapshot = snapshot
+
+        return snapshot
+
+    def status(self, fresh=False):
+        """
+        Return the latest snapshot, probing the database only when asked to
+        or when no snapshot has been taken yet
+        """
+        self.start()
+
+        with self.lock:
+            snapshot = self.snapshot
+
+        if fresh or snapshot is None:
+            snapshot = self.refresh()
+
+        return snapshot
+
+    def start(self):
+        """
+        Start the background refresh thread if it is enabled and not running
+        """
+        if self.interval <= 0 or self.thread is not None:
+            return
+
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.run,
+                                           name='status-probe', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """
+        Stop the background refresh thread
+        """
+        self.stopped.set()
+
+    def run(self):
+        """
+        Background refresh loop
+        """
+        while not self.stopped.is_set():
+            self.refresh()
+            self.stopped.wait(self.interval)
+
+# }}}
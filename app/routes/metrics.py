@@ -0,0 +1,33 @@
+###############################################################################
+## metrics.py for archivist card catalog microservice                        ##
+## Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)            ##
+##                                                                           ##
+## This program is free software; you can redistribute it and/or             ##
+## modify it under the terms of the GNU General Public License               ##
+## as published by the Free Software Foundation; either version 2            ##
+## of the License, or the License, or (at your option) any later             ##
+## version.                                                                  ##
+##                                                                           ##
+## This program is distributed in the hope that it will be useful,           ##
+## but WITHOUT ANY WARRANTY; without even the implied warranty of            ##
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             ##
+## GNU General Public License for more details.                              ##
+###############################################################################
+
+### Commentary ## {{{
+##
+## Metrics routes
+##
+## }}}
+
+### metrics ## {{{
+from flask import Blueprint, Response, current_app
+
+metrics_bp = Blueprint('metrics', __name__, url_prefix='/metrics')
+
+@metrics_bp.route('', methods=['GET'])
+def getMetrics():
+    return Response(current_app.extensions['metrics'].render(),
+                    mimetype='text/plain; version=0.0.4')
+
+## }}}
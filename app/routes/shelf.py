@@ -21,13 +21,25 @@
 ## }}}
 
 ### shelf ## {{{
-import datetime
-from flask import Blueprint, request, jsonify
-from ..models import db, Shelf, RecordType, Collection
+from datetime import datetime, timezone
+import re
+from itertools import groupby
+from json import loads, JSONDecodeError
+from zlib import crc32
+from flask import Blueprint, request, jsonify, current_app, Response, \
+    stream_with_context
+from sqlalchemy.exc import IntegrityError, OperationalError
+from werkzeug.http import http_date
+from ..models import db, Shelf, RecordType, Collection, Tag, IngestJob, \
+    JobState
+from ..models.tags import collectionXtag
+from ..collectioncache import collectionKey
 
 required_fields = ['record_type', 'title', 'filename', 'extension', 'author',
                        'checksum', 'size', 'user']
 
+TRUE_ARGS = ('1', 'true', 'yes')
+
 shelf_bp = Blueprint('shelf', __name__, url_prefix='/shelf')
 
 @shelf_bp.route('', methods=['POST'])
@@ -39,6 +51,9 @@ def shelveCollection():
     if not valid:
         return jsonify(res), 200
 
+    if ingestAsync():
+        return enqueueRecord(json)
+
     user = json.pop('user', None)
     record_data = json.copy()
     record_data['creation_user'] = user
@@ -70,76 +85,379 @@ def shelveCollection():
         'collectionid': collection.collectionid,
     }, 200
 
+@shelf_bp.route('', methods=['GET'])
+def findCollections():
+    if 'ids' in request.args:
+        ids = request.args.get('ids').split(',')
+        try:
+            ids = [int(i) for i in ids if i.strip()]
+        except ValueError:
+            ids = None
+        return batchCollections(ids)
+
+    tagNames = set(request.args.getlist('tag'))
+    matchAll = request.args.get('match', 'all') != 'any'
+    afterCollection = request.args.get('after_collectionid', 0, type=int)
+
+    if len(tagNames) == 0:
+        return {
+            'Ok': False,
+            'ErrMsg': 'At least one tag is required'
+        }, 200
+
+    valid, limit = parseLimit('SHELF_SEARCH_PAGE_SIZE',
+                              'SHELF_SEARCH_MAX_PAGE_SIZE')
+    if not valid:
+        return limit, 200
+
+    # resolve the names through the unique tag name index first
+    tagids = [tagid for (tagid,) in
+              db.session.query(Tag.tagid).filter(Tag.name.in_(tagNames))]
+
+    collections = []
+    nextAfterCollection = None
+    if len(tagids) > 0 and (not matchAll or len(tagids) == len(tagNames)):
+        # walk the (tagid, collectionid) key and keep the collections that
+        # carry every (or any) requested tag
+        matches = db.select(collectionXtag.c.collectionid) \
+                    .where(collectionXtag.c.tagid.in_(tagids),
+                           collectionXtag.c.collectionid > afterCollection) \
+                    .group_by(collectionXtag.c.collectionid)
+        if matchAll:
+            matches = matches.having(db.func.count() == len(tagids))
+        matches = matches.order_by(collectionXtag.c.collectionid) \
+                         .limit(limit + 1).subquery()
+
+        rows = db.session.query(Collection, Shelf) \
+                         .join(matches, matches.c.collectionid ==
+                               Collection.collectionid) \
+                         .outerjoin(Shelf, db.and_(
+                             Shelf.collectionid == Collection.collectionid,
+                             Shelf.edition == Collection.current_edition)) \
+                         .order_by(Collection.collectionid).all()
+
+        if len(rows) > limit:
+            nextAfterCollection = rows[limit - 1][0].collectionid
+        collections = [collection.serialize(record)
+                       for collection, record in rows[:limit]]
+
+    return {
+        'Ok': True,
+        'next_after_collectionid': nextAfterCollection,
+        'collections': collections
+    }, 200
+
+@shelf_bp.route('/batch', methods=['POST'])
+def getCollections():
+    json = request.get_json(silent=True)
+    ids = json.get('ids') if isinstance(json, dict) else None
+    return batchCollections(ids)
+
+@shelf_bp.route('/stats', methods=['GET'])
+def getShelfStats():
+    # aggregates over the whole shelf are only recomputed once per window
+    cache = current_app.extensions['shelf_stats_cache']
+    stats = None
+    if request.args.get('fresh', '') not in TRUE_ARGS:
+        stats = cache.get('shelf:stats')
+
+    if stats is None:
+        stats = shelfStats()
+        cache.set('shelf:stats', stats)
+
+    return {
+        'Ok': True,
+        'stats': stats
+    }, 200
+
+@shelf_bp.route('/search', methods=['GET'])
+def searchCollections():
+    query = request.args.get('q', '').strip()
+    offset = request.args.get('offset', 0, type=int)
+
+    if not query:
+        return {
+            'Ok': False,
+            'ErrMsg': 'A search query is required'
+        }, 200
+
+    if offset < 0:
+        return {
+            'Ok': False,
+            'ErrMsg': 'Offset must be positive'
+        }, 200
+
+    valid, limit = parseLimit('SHELF_SEARCH_PAGE_SIZE',
+                              'SHELF_SEARCH_MAX_PAGE_SIZE')
+    if not valid:
+        return limit, 200
+
+    matches = searchMatches(query)
+    if matches is None:
+        return {
+            'Ok': True,
+            'next_offset': None,
+            'collections': []
+        }, 200
+
+    # rank the current editions only, older editions stay in the index
+    try:
+        rows = db.session.query(Collection, Shelf) \
+                         .join(Shelf, db.and_(
+                             Shelf.collectionid == Collection.collectionid,
+                             Shelf.edition == Collection.current_edition)) \
+                         .join(matches, matches.c.recordid == Shelf.recordid) \
+                         .order_by(matches.c.score, Shelf.recordid) \
+                         .offset(offset).limit(limit + 1).all()
+    except OperationalError:
+        return {
+            'Ok': False,
+            'ErrMsg': 'Full-text search is not available'
+        }, 200
+
+    return {
+        'Ok': True,
+        'next_offset': offset + limit if len(rows) > limit else None,
+        'collections': [collection.serialize(record)
+                        for collection, record in rows[:limit]]
+    }, 200
+
+@shelf_bp.route('/bulk', methods=['POST'])
+def shelveCollections():
+    # accept either a json array or a newline delimited json stream
+    try:
+        items = parseBulkPayload()
+    except (ValueError, TypeError) as err:
+        return {
+            'Ok': False,
+            'ErrMsg': 'Invalid bulk payload: {0}'.format(err)
+        }, 200
+
+    maxRecords = current_app.config.get('SHELF_BULK_MAX_RECORDS', 10000)
+    if len(items) > maxRecords:
+        return {
+            'Ok': False,
+            'ErrMsg': 'Bulk payload exceeds {0} records'.format(maxRecords)
+        }, 200
+
+    # validate everything up front so only good records reach the database
+    results = [None] * len(items)
+    pending = []
+    for index, item in enumerate(items):
+        valid, res = validateRecordData(item)
+        if valid:
+            pending.append(index)
+        else:
+            results[index] = {'index': index, **res}
+
+    chunkSize = current_app.config.get('SHELF_BULK_CHUNK_SIZE', 500)
+    for start in range(0, len(pending), chunkSize):
+        chunk = pending[start:start + chunkSize]
+        try:
+            ids = shelveChunk([items[index] for index in chunk])
+        except Exception as err:
+            db.session.rollback()
+            for index in chunk:
+                results[index] = {
+                    'index': index,
+                    'Ok': False,
+                    'ErrMsg': 'Error commiting record "{0}"'.format(err)
+                }
+            continue
+
+        for index, collectionid in zip(chunk, ids):
+            results[index] = {
+                'index': index,
+                'Ok': True,
+                'collectionid': collectionid
+            }
+
+    return {
+        'Ok': True,
+        'results': results
+    }, 200
+
+@shelf_bp.route('/export', methods=['GET'])
+def exportCatalog():
+    includeEditions = request.args.get('editions', '') in TRUE_ARGS
+    includeTags = request.args.get('tags', '') in TRUE_ARGS
+    batchSize = current_app.config.get('SHELF_EXPORT_BATCH_SIZE', 1000)
+
+    lines = exportLines(includeEditions, includeTags, batchSize)
+    return Response(stream_with_context(lines),
+                    mimetype='application/x-ndjson')
+
+@shelf_bp.route('/checksum/<string:checksum>', methods=['GET'])
+def getChecksum(checksum):
+    matches = findChecksums([checksum])
+
+    if checksum not in matches:
+        return {
+            'Ok': False,
+            'ErrMsg': 'Unknown checksum {0}'.format(checksum)
+        }, 200
+
+    return {
+        'Ok': True,
+        'checksum': checksum,
+        'records': matches[checksum]
+    }, 200
+
+@shelf_bp.route('/checksum/lookup', methods=['POST'])
+def lookupChecksums():
+    json = request.get_json(silent=True)
+    checksums = json.get('checksums') if isinstance(json, dict) else None
+
+    if not isinstance(checksums, list) or \
+            not all(isinstance(c, str) for c in checksums):
+        return {
+            'Ok': False,
+            'ErrMsg': 'checksums must be a list of strings'
+        }, 200
+
+    maxChecksums = current_app.config.get('SHELF_CHECKSUM_LOOKUP_MAX', 1000)
+    if len(checksums) > maxChecksums:
+        return {
+            'Ok': False,
+            'ErrMsg': 'Lookup exceeds {0} checksums'.format(maxChecksums)
+        }, 200
+
+    matches = findChecksums(checksums)
+
+    return {
+        'Ok': True,
+        'found': matches,
+        'missing': [c for c in dict.fromkeys(checksums) if c not in matches]
+    }, 200
+
+@shelf_bp.route('/jobs/<int:jobid>', methods=['GET'])
+def getJob(jobid):
+    job = db.session.get(IngestJob, jobid)
+
+    if job is None:
+        return {
+            'Ok': False,
+            'ErrMsg': 'Unknown job {0}'.format(jobid)
+        }, 200
+
+    return {
+        'Ok': True,
+        'job': job.serialize()
+    }, 200
+
 @shelf_bp.route('/<int:id>', methods=['GET'])
 def getRecord(id):
-    collection = Collection.query.filter_by(collectionid = id).first()
+    valid, fields = parseFields()
+    if not valid:
+        return fields, 200
 
-    if collection is None:
+    validators = collectionValidators(id)
+    if validators is None:
         return {
             'Ok': False,
             'ErrMsg': 'Unknown collection {0}'.format(id)
         }, 200
+    if notModified(validators):
+        return '', 304, validatorHeaders(validators)
+
+    cache = current_app.extensions['collection_cache']
+    collection = cache.get(collectionKey(id, validators[2]))
+    if collection is None:
+        # join only the current edition's row rather than every edition,
+        # all of its columns so the whole collection can be cached
+        row = db.session.query(Collection, *Shelf.__table__.c) \
+                        .outerjoin(Shelf, db.and_(
+                            Shelf.collectionid == Collection.collectionid,
+                            Shelf.edition == Collection.current_edition)) \
+                        .filter(Collection.collectionid == id).first()
+
+        if row is None:
+            return {
+                'Ok': False,
+                'ErrMsg': 'Unknown collection {0}'.format(id)
+            }, 200
+
+        collection = row[0].serialize(None)
+        if row.recordid is not None:
+            collection['edition'] = Shelf.serialize_row(
+                row, Shelf.__table__.c.keys())
+        cache.set(collectionKey(id, row[0].current_edition), collection)
+
+    # project a copy, the cached collection is shared between requests
+    collection = dict(collection)
+    if collection['edition']:
+        collection['edition'] = {field: collection['edition'][field]
+                                 for field in fields}
 
     return {
         'Ok': True,
-        'collection': collection.serialize()
-    }
+        'collection': collection
+    }, 200, validatorHeaders(validators)
 
 @shelf_bp.route('/<int:id>', methods=['POST'])
 def addEdition(id):
-    # check that the collectio supplied exists
-    collection = Collection.query.filter_by(collectionid = id).first()
-    if collection is None:
-        return {
-            'Ok': False,
-            'ErrMsg': 'Unknown collection {0}'.format(id)
-        }
-
     json = request.get_json()
 
     valid, res = validateRecordData(json)
     if not valid:
         return jsonify(res), 200
 
-    newEditionNumber = collection.current_edition + 1
+    if ingestAsync():
+        return enqueueRecord(json, id)
 
-    user = json.pop('user', None)
-    record_data = json.copy()
-    record_data['creation_user'] = user
-    record_data['edition'] = newEditionNumber
-    record_data['collectionid'] = collection.collectionid
-
-    try:
-        record = Shelf(**record_data)
-
-        collection.current_edition = newEditionNumber
-        collection.modified_user = user
-        collection.records.append(record)
-        collection.modified_date = datetime.utcnow()
-        db.session.add(record)
-        db.session.commit()
-    except:
-        pass
+    shelved, res = shelveEdition(id, shelfRecordData(json))
+    if not shelved:
+        return res, 200
 
     return {
         'Ok': True,
-        'collection': collection.serialize()
+        'collection': db.session.get(Collection, id).serialize(res)
     }, 200
 
 @shelf_bp.route('/<int:id>/edition')
 def getCollectionEditions(id):
-    collection = Collection.query.filter_by(collectionid = id).first()
-    if collection is None:
+    validators = collectionValidators(id)
+    if validators is None:
         return {
             'Ok': False,
             'ErrMsg': 'Unknown collection {0}'.format(id)
         }
 
+    valid, fields = parseFields()
+    if not valid:
+        return fields, 200
+
+    if notModified(validators):
+        return '', 304, validatorHeaders(validators)
+
+    # keyset pagination over (collectionid, edition)
+    afterEdition = request.args.get('after_edition', 0, type=int)
+    valid, limit = parseLimit('SHELF_EDITION_PAGE_SIZE',
+                              'SHELF_EDITION_MAX_PAGE_SIZE')
+    if not valid:
+        return limit, 200
+
     try:
+        count = db.session.query(db.func.count(Shelf.recordid)) \
+                          .filter(Shelf.collectionid == id).scalar()
+
+        # fetch one extra row to know whether another page follows
+        # plain rows, the editions are never used as Shelf objects
+        records = db.session.query(*fieldColumns(fields)) \
+                            .filter(Shelf.collectionid == id,
+                                    Shelf.edition > afterEdition) \
+                            .order_by(Shelf.edition) \
+                            .limit(limit + 1).all()
+        nextAfterEdition = records[limit - 1].edition \
+            if len(records) > limit else None
+
         retval = {
             "Ok": True,
-            "collectionid": collection.collectionid,
-            "editions": list(map(lambda r: r.serialize(), collection.records))
+            "collectionid": id,
+            "Count": count,
+            "next_after_edition": nextAfterEdition,
+            "editions": [Shelf.serialize_row(r, fields)
+                         for r in records[:limit]]
         }
     except:
         return {
@@ -147,32 +465,51 @@ def getCollectionEditions(id):
             "ErrMsg": "Error occured while retrieving edition information"
         }, 200
 
-    return retval, 200
+    return retval, 200, validatorHeaders(validators)
 
 @shelf_bp.route('/<int:collectionid>/edition/<int:editionid>')
 def getEdition(collectionid, editionid):
-    collection = Collection.query.filter_by(collectionid = collectionid).first()
-    if collection is None:
+    valid, fields = parseFields()
+    if not valid:
+        return fields, 200
+
+    validators = collectionValidators(collectionid)
+    if validators is None:
+        return {
+            'Ok': False,
+            'ErrMsg': 'Unknown collection {0}'.format(collectionid)
+        }, 200
+    if notModified(validators):
+        return '', 304, validatorHeaders(validators)
+
+    # one (collectionid, edition) index read for both the collection and
+    # the edition
+    row = db.session.query(Collection.current_edition,
+                           *fieldColumns(fields)) \
+                    .outerjoin(Shelf, db.and_(
+                        Shelf.collectionid == Collection.collectionid,
+                        Shelf.edition == editionid)) \
+                    .filter(Collection.collectionid == collectionid).first()
+    if row is None:
         return {
             'Ok': False,
             'ErrMsg': 'Unknown collection {0}'.format(collectionid)
         }, 200
 
-    edition = next(filter(lambda r: r.edition == editionid, collection.records),
-                   None)
-
-    if edition is None:
+    if row.recordid is None:
+        count = db.session.query(db.func.count(Shelf.recordid)) \
+                          .filter(Shelf.collectionid == collectionid).scalar()
         return {
             'Ok': False,
-            'Count': len(collection.records),
+            'Count': count,
             'ErrMsg': 'Unknown edition {0}'.format(editionid)
         }, 200
 
     try:
         retval = {
-            "collectionid": collection.collectionid,
+            "collectionid": collectionid,
             "Ok": True,
-            "edition": edition.serialize()
+            "edition": Shelf.serialize_row(row, fields)
         }
     except Exception as err:
         return {
@@ -180,7 +517,458 @@ def getEdition(collectionid, editionid):
             "ErrMsg": f"Error retrieving edition {err=}"
         }, 200
 
-    return retval, 200
+    return retval, 200, validatorHeaders(validators)
+
+
+def collectionValidators(id):
+    """
+    Return the (etag, last modified, current edition) validators of
+    collection id from a single primary key read, or None if the collection
+    does not exist
+    """
+    row = db.session.query(Collection.current_edition,
+                           Collection.modified_date) \
+                    .filter(Collection.collectionid == id).first()
+    if row is None:
+        return None
+
+    lastModified = None
+    if row.modified_date is not None:
+        # http dates only carry whole seconds
+        lastModified = row.modified_date.replace(microsecond=0)
+        if lastModified.tzinfo is None:
+            lastModified = lastModified.replace(tzinfo=timezone.utc)
+
+    # every change to a collection bumps current_edition, the query string
+    # separates the representations (fields, paging) of the same collection
+    etag = '{0}-{1}-{2}-{3:x}'.format(
+        id, row.current_edition,
+        int(lastModified.timestamp()) if lastModified else 0,
+        crc32(request.query_string))
+
+    return etag, lastModified, row.current_edition
+
+def notModified(validators):
+    """
+    Return True if the request's conditional headers match the validators
+    """
+    etag, lastModified, _ = validators
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+
+    since = request.if_modified_since
+    return since is not None and lastModified is not None \
+        and lastModified <= since
+
+def validatorHeaders(validators):
+    """
+    Return the ETag and Last-Modified response headers for the validators
+    """
+    etag, lastModified, _ = validators
+    headers = {'ETag': 'W/"{0}"'.format(etag)}
+    if lastModified is not None:
+        headers['Last-Modified'] = http_date(lastModified)
+    return headers
+
+def batchCollections(ids):
+    """
+    Return the response of a batch read of the collections ids with their
+    current editions, keyed by collection id with the unknown ids listed
+    separately
+    """
+    if not isinstance(ids, list) or \
+            not all(isinstance(i, int) and not isinstance(i, bool)
+                    for i in ids):
+        return {
+            'Ok': False,
+            'ErrMsg': 'ids must be a list of integers'
+        }, 200
+
+    ids = list(dict.fromkeys(ids))
+    maxIds = current_app.config.get('SHELF_BATCH_MAX', 1000)
+    if len(ids) > maxIds:
+        return {
+            'Ok': False,
+            'ErrMsg': 'Batch exceeds {0} collections'.format(maxIds)
+        }, 200
+
+    valid, fields = parseFields()
+    if not valid:
+        return fields, 200
+
+    # one IN query on the primary key, joined to the current editions only
+    collections = {}
+    if ids:
+        rows = db.session.query(Collection, *fieldColumns(fields)) \
+                         .outerjoin(Shelf, db.and_(
+                             Shelf.collectionid == Collection.collectionid,
+                             Shelf.edition == Collection.current_edition)) \
+                         .filter(Collection.collectionid.in_(ids))
+        for row in rows:
+            collection = row[0].serialize(None)
+            if row.recordid is not None:
+                collection['edition'] = Shelf.serialize_row(row, fields)
+            collections[row[0].collectionid] = collection
+
+    return {
+        'Ok': True,
+        'collections': {str(i): collections[i] for i in ids
+                        if i in collections},
+        'missing': [i for i in ids if i not in collections]
+    }, 200
+
+def shelfStats():
+    """
+    Return the record counts and byte totals of every shelved record grouped
+    by record_type, extension and creation_user, each group by read off its
+    (column, size_bytes) index
+    """
+    stats = {'computed': datetime.now(timezone.utc)}
+    for name in ('record_type', 'extension', 'creation_user'):
+        column = Shelf.__table__.c[name]
+        rows = db.session.query(column,
+                                db.func.count(),
+                                db.func.count(Shelf.size_bytes),
+                                db.func.sum(Shelf.size_bytes)) \
+                         .group_by(column).order_by(column).all()
+        stats['by_' + name] = [{
+            name: value,
+            'records': records,
+            'unsized': records - sized,
+            'bytes': int(total or 0)
+        } for value, records, sized, total in rows]
+
+    groups = stats['by_record_type']
+    stats['records'] = sum(group['records'] for group in groups)
+    stats['unsized'] = sum(group['unsized'] for group in groups)
+    stats['bytes'] = sum(group['bytes'] for group in groups)
+
+    return stats
+
+def searchMatches(query):
+    """
+    Return a (recordid, score) subquery of the shelf records matching the
+    search query from the dialect's full-text index, best matches scored
+    lowest, or None if the query has nothing to search for
+    """
+    if db.engine.dialect.name == 'mysql':
+        match = 'MATCH (title, author, filename) ' \
+                'AGAINST (:q IN NATURAL LANGUAGE MODE)'
+        statement = db.text(f'SELECT recordid, -{match} AS score '
+                            f'FROM shelf WHERE {match}')
+    else:
+        # every word as a quoted fts5 string so punctuation in the query
+        # can not be read as query syntax
+        words = re.findall(r'\w+', query)
+        if not words:
+            return None
+        query = ' '.join('"{0}"'.format(word) for word in words)
+        statement = db.text('SELECT rowid AS recordid, bm25(shelf_fts) '
+                            'AS score FROM shelf_fts WHERE shelf_fts MATCH :q')
+
+    return statement.bindparams(q=query) \
+                    .columns(recordid=db.Integer, score=db.Float).subquery()
+
+def parseBulkPayload():
+    """
+    Return the list of record payloads posted to the bulk endpoint, either
+    as a json array or as newline delimited json
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonlines'):
+        items = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(loads(line))
+            except JSONDecodeError:
+                # keep the position so the error is reported per item
+                items.append(None)
+        return items
+
+    items = request.get_json()
+    if not isinstance(items, list):
+        raise TypeError('expected a list of records')
+    return items
+
+
+def shelveChunk(items):
+    """
+    Shelve a chunk of validated record payloads in a single transaction and
+    return the new collection ids in order
+    """
+    table = Collection.__table__
+    rows = [{'current_edition': 1,
+             'creation_user': item['user'],
+             'modified_user': item['user']} for item in items]
+
+    if db.session.get_bind().dialect.insert_executemany_returning:
+        # one executemany handing the generated keys back
+        insert = table.insert().returning(table.c.collectionid)
+        ids = db.session.execute(insert, rows).scalars().all()
+    else:
+        # the driver can not return keys from an executemany, one insert per
+        # collection but no objects to reload after the commit
+        ids = [db.session.execute(table.insert(), row).inserted_primary_key[0]
+               for row in rows]
+
+    records = []
+    for collectionid, item in zip(ids, items):
+        record_data = shelfRecordData(item)
+        record_data['edition'] = 1
+        record_data['collectionid'] = collectionid
+        records.append(record_data)
+
+    # shelf rows need no generated keys back so insert them executemany style
+    db.session.execute(Shelf.__table__.insert(), records)
+    db.session.commit()
+
+    return ids
+
+
+def shelveEdition(id, record_data):
+    """
+    Append record_data as the next edition of collection id
+
+    The edition number is taken with an atomic update of current_edition,
+    the collection row stays locked until the commit so concurrent editions
+    queue up behind it. Duplicate editions and lock errors are retried up to
+    SHELF_EDITION_RETRIES times.
+
+    Returns whether the edition was shelved and either the new Shelf record
+    or the error response
+    """
+    user = record_data['creation_user']
+    retries = current_app.config.get('SHELF_EDITION_RETRIES', 3)
+    lastErr = None
+
+    for attempt in range(retries):
+        # after a duplicate edition move past the highest edition on the
+        # shelf, a max over the (collectionid, edition) index
+        nextEdition = Collection.current_edition + 1 if attempt == 0 else \
+            db.select(db.func.max(Shelf.edition) + 1) \
+              .where(Shelf.collectionid == id).scalar_subquery()
+
+        try:
+            result = db.session.execute(
+                db.update(Collection)
+                  .where(Collection.collectionid == id)
+                  .values(current_edition=nextEdition,
+                          modified_user=user,
+                          modified_date=db.func.now())
+                  .execution_options(synchronize_session=False))
+            if result.rowcount == 0:
+                db.session.rollback()
+                return False, {
+                    'Ok': False,
+                    'ErrMsg': 'Unknown collection {0}'.format(id)
+                }
+
+            newEditionNumber = db.session.query(Collection.current_edition) \
+                                         .filter(Collection.collectionid == id) \
+                                         .scalar()
+            record = Shelf(**record_data, collectionid=id,
+                           edition=newEditionNumber)
+            db.session.add(record)
+            db.session.commit()
+            return True, record
+        except (IntegrityError, OperationalError) as err:
+            # the (collectionid, edition) index rejected a duplicate edition
+            # or the transaction lost a lock, take a new number
+            db.session.rollback()
+            lastErr = err
+
+    return False, {
+        'Ok': False,
+        'ErrMsg': 'Error commiting edition "{0}"'.format(lastErr)
+    }
+
+
+def ingestAsync():
+    """
+    Whether the shelving request should be queued rather than committed
+    inside the request, never when this process runs no ingest workers to
+    drain the queue
+    """
+    if current_app.extensions['ingest_queue'].workers <= 0:
+        return False
+    if 'async' in request.args:
+        return request.args['async'] in TRUE_ARGS
+    return current_app.config.get('SHELF_ASYNC_INGEST', False)
+
+
+def enqueueRecord(json, collectionid=None):
+    """
+    Queue validated record data for the ingest workers, as a new collection
+    or as a new edition of collectionid
+    """
+    try:
+        jobid = current_app.extensions['ingest_queue'].enqueue(json,
+                                                               collectionid)
+    except Exception as err:
+        return {
+            'Ok': False,
+            'ErrMsg': 'Error queueing record "{0}"'.format(err)
+        }, 200
+
+    return {
+        'Ok': True,
+        'jobid': jobid,
+        'state': JobState.QUEUED.value
+    }, 200
+
+
+def shelfRecordData(json):
+    """
+    Map validated record data onto the shelf columns
+    """
+    record_data = {field: json[field] for field in required_fields
+                   if field != 'user'}
+    record_data['creation_user'] = json['user']
+
+    return record_data
+
+
+def findChecksums(checksums):
+    """
+    Resolve checksums to the (collectionid, edition) of the records that
+    carry them with a single query on the checksum index
+
+    Returns a dictionary of checksum to the list of matching records, only
+    containing the checksums that were found
+    """
+    matches = {}
+    rows = db.session.query(Shelf.checksum, Shelf.collectionid, Shelf.edition) \
+                     .filter(Shelf.checksum.in_(set(checksums))) \
+                     .order_by(Shelf.collectionid, Shelf.edition)
+    for row in rows:
+        matches.setdefault(row.checksum, []).append({
+            "collectionid": row.collectionid,
+            "edition": row.edition
+        })
+
+    return matches
+
+
+def parseFields():
+    """
+    Read the comma separated shelf columns of the fields request argument,
+    every column when it is not given
+
+    Returns whether the fields are valid and either the list of field
+    names or the error response
+    """
+    fields = request.args.get('fields')
+    if not fields:
+        return True, list(Shelf.__table__.c.keys())
+
+    fields = list(dict.fromkeys(f.strip() for f in fields.split(',')
+                                if f.strip()))
+    unknown = [f for f in fields if f not in Shelf.__table__.c]
+    if unknown:
+        return False, {
+            'Ok': False,
+            'ErrMsg': 'Unknown fields {0}'.format(', '.join(unknown))
+        }
+
+    return True, fields
+
+
+def fieldColumns(fields):
+    """
+    Shelf columns to select for the given fields, always including the
+    recordid and edition the routes need themselves
+    """
+    names = dict.fromkeys(['recordid', 'edition', *fields])
+    return [Shelf.__table__.c[name] for name in names]
+
+
+def parseLimit(sizeKey, maxKey):
+    """
+    Read the limit request argument, defaulting to and bounded by the
+    given configuration keys
+
+    Returns whether the limit is valid and either the limit or the error
+    response
+    """
+    maxLimit = current_app.config.get(maxKey, 1000)
+    limit = request.args.get('limit', current_app.config.get(sizeKey, 100),
+                             type=int)
+    if limit < 1 or limit > maxLimit:
+        return False, {
+            'Ok': False,
+            'ErrMsg': 'limit must be between 1 and {0}'.format(maxLimit)
+        }
+
+    return True, limit
+
+
+def exportLines(includeEditions, includeTags, batchSize):
+    """
+    Generate one json line per collection in collectionid order, reading the
+    catalog in a single streamed pass
+
+    Keyword arguments:
+    includeEditions -- add every edition of the collection under editions
+    includeTags -- add the collection tags under tags
+    batchSize -- number of rows fetched from the cursor at a time
+    """
+    if includeEditions:
+        onClause = Shelf.collectionid == Collection.collectionid
+    else:
+        onClause = db.and_(Shelf.collectionid == Collection.collectionid,
+                           Shelf.edition == Collection.current_edition)
+
+    stmt = db.select(Collection, Shelf) \
+             .join(Shelf, onClause) \
+             .order_by(Collection.collectionid, Shelf.edition) \
+             .execution_options(yield_per=batchSize)
+    rows = db.session.execute(stmt)
+
+    # the tag stream needs its own connection while the records stream is open
+    tagConn = db.engine.connect() if includeTags else None
+    tagGroups = iter(())
+    if tagConn is not None:
+        tagStmt = db.select(collectionXtag.c.collectionid, Tag.tagid, Tag.name) \
+                    .join(Tag, Tag.tagid == collectionXtag.c.tagid) \
+                    .order_by(collectionXtag.c.collectionid, Tag.tagid)
+        tagRows = tagConn.execution_options(stream_results=True,
+                                            yield_per=batchSize) \
+                         .execute(tagStmt)
+        tagGroups = groupby(tagRows, key=lambda r: r.collectionid)
+    nextTags = next(tagGroups, None)
+
+    try:
+        for _, group in groupby(rows, key=lambda r: r[0].collectionid):
+            group = list(group)
+            collection = group[0][0]
+            records = [record for _, record in group]
+
+            current = next(filter(lambda r:
+                                  r.edition == collection.current_edition,
+                                  records), None)
+            line = collection.serialize(current)
+            if includeEditions:
+                line['editions'] = list(map(lambda r: r.serialize(), records))
+
+            if includeTags:
+                # both streams are ordered by collectionid so merge them
+                while nextTags is not None and \
+                        nextTags[0] < collection.collectionid:
+                    nextTags = next(tagGroups, None)
+                line['tags'] = []
+                if nextTags is not None and \
+                        nextTags[0] == collection.collectionid:
+                    line['tags'] = [{"tagid": t.tagid, "name": t.name}
+                                    for t in nextTags[1]]
+                    nextTags = next(tagGroups, None)
+
+            yield current_app.json.dumps(line) + '\n'
+    finally:
+        rows.close()
+        if tagConn is not None:
+            tagConn.close()
 
 
 def validateRecordData(json):
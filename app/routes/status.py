@@ -24,69 +24,54 @@
 from flask import Blueprint, request, jsonify, current_app
 from sqlalchemy import desc
 from ..models import db, CardCatalog
-from ..version import VERSION, APPNAME
+from ..version import VERSION
+from ..migrations import installedVersion, migrate, versionKey
 
 
 status_bp = Blueprint('status', __name__, url_prefix='/status')
 
 @status_bp.route('', methods=['GET'])
 def getStatus():
-    res = dict()
-    dbInfo = dict()
+    # serve the probe snapshot so health checks stay off the database
+    fresh = request.args.get('fresh', '') in ('1', 'true', 'yes')
+    res = {
+        **current_app.extensions['status_probe'].status(fresh),
+        'tagCache': current_app.extensions['tag_cache'].stats(),
+        'collectionCache':
+            current_app.extensions['collection_cache'].stats()
+    }
 
-    try:
-        rec = CardCatalog.query.order_by(desc(CardCatalog.version)).first()
-        if rec is None:
-            dbInfo['status'] = 'Uninitialized'
-            dbInfo['errMsg'] = 'Application version not found'
-        else:
-            dbInfo['status'] = 'Initialized'
-            dbInfo = {**dbInfo, **(rec.serialize()) }
-
-    except Exception as err:
-        dbInfo['status'] = 'Uninitialized'
-        dbInfo['errMsg'] = 'Error retrieving application version: "{0}"'.format(err)
-
-    res['database'] = dbInfo
-    print(res)
     return jsonify(res), 200
 
 init_bp = Blueprint('init', __name__, url_prefix='/init')
 
 @init_bp.route('', methods=['POST'])
 def initializeDatabase():
-    rec = None
-    dbExists = False
-
-    # Check to see if the application table has existing entries
+    # find out which schema version the database is at, if any
     try:
-        rec = CardCatalog.query.order_by(desc(CardCatalog.version)).first()
-        dbExists = True
-    except:
-        dbExists = False
-        rec = None
+        installed = installedVersion()
+    except Exception as err:
+        return { 'Ok': False,
+                 'ErrMsg': 'Error reading database version: {0}'.format(err) }, 200
 
-    if rec is not None:
+    if installed is not None and versionKey(installed) >= versionKey(VERSION):
         return { 'Ok': False,
-                 'ErrMsg': 'Database already initialized with version {0}'.format(rec.version)}, 200
+                 'ErrMsg': 'Database already initialized with version {0}'.format(installed)}, 200
 
-    # If the query above fails the database has not been created
-    if dbExists == False:
-        try:
-            db.create_all()
-        except:
-            return { 'Ok': False,
-                     'ErrMsg': 'Error creating database' }, 200
-    # Add the application information to the application table
+    # create the schema or upgrade it through the pending migrations
     try:
-        newRec = CardCatalog(name=APPNAME,version=VERSION)
-        db.session.add(newRec)
-        db.session.commit()
-
-        return { 'Ok': True,
-                 'response': newRec.serialize() }, 200
+        applied = migrate(installed,
+                          current_app.config.get('MIGRATION_BATCH_SIZE', 1000))
     except Exception as err:
+        db.session.rollback()
         return { 'Ok': False,
-                 'ErrMsg': 'Error initializing application version: {0}'.format(err) }, 200
+                 'ErrMsg': 'Error migrating database: {0}'.format(err) }, 200
+
+    current_app.extensions['status_probe'].refresh()
+    rec = CardCatalog.query.order_by(desc(CardCatalog.id)).first()
+
+    return { 'Ok': True,
+             'response': rec.serialize(),
+             'migrations': applied }, 200
 
 ## }}}
@@ -21,107 +21,392 @@
 ## }}}
 
 ### tag ## {{{
-import datetime
-from flask import Blueprint, request, jsonify
-from ..models import db, Tag
+from flask import Blueprint, request, current_app
+from sqlalchemy.exc import IntegrityError
+from ..models import db, Tag, Collection
+from ..models.tags import collectionXtag
+from .shelf import parseLimit
 
 tag_bp = Blueprint('tag', __name__, url_prefix='/tag')
 
 @tag_bp.route('', methods=['POST'])
 def addTag():
-    # verify that data was sent with the post request
+    valid, res = validateTagData(request.get_json(silent=True))
+    if not valid:
+        return res, 200
+
+    # check to see if the tag already exists
+    tagName = res
+    if tagCache().by_name(tagName) is not None:
+        return {
+            'Ok': False,
+            'ErrMsg': f'Tag {tagName} already exists'
+        }, 200
+
     try:
-        request
-    except:
+        ret = Tag(name=tagName)
+        db.session.add(ret)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return {
+            'Ok': False,
+            'ErrMsg': f'Tag {tagName} already exists'
+        }, 200
+    except Exception as err:
+        db.session.rollback()
         return {
             'Ok': False,
-            'ErrMsg': 'Missing post data'
+            'ErrMsg': f'Unknown error add Tag: {err=}'
         }, 200
 
-    json = {}
+    return {
+        'Ok': True,
+        'tagId': ret.tagid
+    }, 200
 
-    # verify that the json data sent with the post request contains a
-    # tagName key
-    try:
-        json = request.get_json()
+@tag_bp.route('', methods=['GET'])
+def listTags():
+    valid, limit = parseLimit('TAG_PAGE_SIZE', 'TAG_MAX_PAGE_SIZE')
+    if not valid:
+        return limit, 200
 
-        if json is None or 'tagName' not in list(json.keys()):
-            return {
-                'Ok': False,
-                'ErrMsg': 'Tag Name is missing from the request'
-            }, 200
-    except Exception as err:
-        return json, 404
+    # keyset pagination down the (collection_count, tagid) index, most
+    # used tags first
+    query = db.session.query(Tag.tagid, Tag.name, Tag.collection_count)
+    afterCount = request.args.get('after_count', type=int)
+    afterTag = request.args.get('after_tagid', type=int)
+    if afterCount is not None and afterTag is not None:
+        query = query.filter(db.tuple_(Tag.collection_count, Tag.tagid) <
+                             db.tuple_(afterCount, afterTag))
 
-    # check to see if the tag already exists
-    tagName = json['tagName']
-    tag = Tag.query.filter_by(name = tagName).first()
+    rows = query.order_by(Tag.collection_count.desc(), Tag.tagid.desc()) \
+                .limit(limit + 1).all()
+    last = rows[limit - 1] if len(rows) > limit else None
+
+    return {
+        'Ok': True,
+        'next_after_count': last.collection_count if last else None,
+        'next_after_tagid': last.tagid if last else None,
+        'tags': [{
+            'tagid': row.tagid,
+            'name': row.name,
+            'collection_count': row.collection_count
+        } for row in rows[:limit]]
+    }, 200
+
+@tag_bp.route('<int:id>', methods=['GET'])
+def getTagById(id):
+    return getTag(tagCache().by_id(id), id)
+
+@tag_bp.route('<string:tagName>', methods=['GET'])
+def getTagByName(tagName):
+    return getTag(tagCache().by_name(tagName), tagName)
+
+@tag_bp.route('<int:id>', methods=['PUT'])
+def updateTagById(id):
+    return updateTag(tagCache().by_id(id), id)
+
+@tag_bp.route('<string:tagName>', methods=['PUT'])
+def updateTagByName(tagName):
+    return updateTag(tagCache().by_name(tagName), tagName)
+
+@tag_bp.route('<int:id>', methods=['DELETE'])
+def deleteTagById(id):
+    return deleteTag(tagCache().by_id(id), id)
+
+@tag_bp.route('<string:tagName>', methods=['DELETE'])
+def deleteTagByName(tagName):
+    return deleteTag(tagCache().by_name(tagName), tagName)
+
+@tag_bp.route('<int:id>/collections', methods=['POST'])
+def tagCollections(id):
+    entry = tagCache().by_id(id)
+    if entry is None:
+        return unknownTag(id)
 
-    if tag is not None:
+    valid, ids = validateCollectionIds(request.get_json(silent=True))
+    if not valid:
+        return ids, 200
+
+    added = 0
+    missing = []
+    try:
+        for chunk in chunks(ids):
+            found = {collectionid for (collectionid,) in
+                     db.session.query(Collection.collectionid)
+                               .filter(Collection.collectionid.in_(chunk))}
+            missing.extend(i for i in chunk if i not in found)
+            added += assignTag(id, found)
+    except Exception as err:
+        db.session.rollback()
         return {
             'Ok': False,
-            'ErrMsg': f'Tag {tagName=} already exists'
+            'added': added,
+            'ErrMsg': f'Unknown error tagging collections: {err=}'
         }, 200
 
-    ret = None
-    data = {
-        'name': tagName
-    }
+    return {
+        'Ok': True,
+        'tagId': id,
+        'added': added,
+        'missing': missing
+    }, 200
+
+@tag_bp.route('<int:id>/collections', methods=['DELETE'])
+def untagCollections(id):
+    entry = tagCache().by_id(id)
+    if entry is None:
+        return unknownTag(id)
+
+    valid, ids = validateCollectionIds(request.get_json(silent=True))
+    if not valid:
+        return ids, 200
 
+    removed = 0
     try:
-        ret = Tag(name='foobar')
-        db.session.add(tag)
-        db.session.commit()
+        for chunk in chunks(ids):
+            count = db.session.execute(
+                collectionXtag.delete()
+                              .where(collectionXtag.c.tagid == id,
+                                     collectionXtag.c.collectionid.in_(chunk))
+            ).rowcount
+            countCollections(id, -count)
+            db.session.commit()
+            removed += count
     except Exception as err:
+        db.session.rollback()
         return {
             'Ok': False,
-            'ErrMsg': f'Unknown error add Tag: {err=}'
+            'removed': removed,
+            'ErrMsg': f'Unknown error untagging collections: {err=}'
         }, 200
 
     return {
         'Ok': True,
-        'tagId': ret.tagid
+        'tagId': id,
+        'removed': removed
     }, 200
 
-@tag_bp.route('<int:id>', methods=['GET'])
-def getTagById():
-    return {
-        'Ok': False,
-        'ErrMsg': 'Not Implemented'
-    }, 404
 
-@tag_bp.route('<string:tagName>', methods=['GET'])
-def getTagByName():
-    return {
-        'Ok': False,
-        'ErrMsg': 'Not Implemented'
-    }, 404
+def tagCache():
+    """
+    Return the tag cache of the current application
+    """
+    return current_app.extensions['tag_cache']
 
-@tag_bp.route('<int:id>', methods=['PUT'])
-def updateTagById():
+
+def unknownTag(key):
+    """
+    Response for a tag that does not exist
+    """
     return {
         'Ok': False,
-        'ErrMsg': 'Not Implemented'
-    }, 404
+        'ErrMsg': f'Unknown tag {key}'
+    }, 200
+
+
+def getTag(entry, key):
+    """
+    Response for a (tagid, name) cache entry
+    """
+    if entry is None:
+        return unknownTag(key)
 
-@tag_bp.route('<string:tagName>', methods=['PUT'])
-def updateTagByName():
     return {
-        'Ok': False,
-        'ErrMsg': 'Not Implemented'
-    }, 404
+        'Ok': True,
+        'tag': {
+            'tagid': entry[0],
+            'name': entry[1]
+        }
+    }, 200
+
+
+def updateTag(entry, key):
+    """
+    Rename the tag of a (tagid, name) cache entry to the posted tagName
+    """
+    if entry is None:
+        return unknownTag(key)
+
+    valid, res = validateTagData(request.get_json(silent=True))
+    if not valid:
+        return res, 200
+
+    try:
+        tag = db.session.get(Tag, entry[0])
+        tag.name = res
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return {
+            'Ok': False,
+            'ErrMsg': f'Tag {res} already exists'
+        }, 200
+    except Exception as err:
+        db.session.rollback()
+        return {
+            'Ok': False,
+            'ErrMsg': f'Unknown error updating Tag: {err=}'
+        }, 200
 
-@tag_bp.route('<int:id>', methods=['DELETE'])
-def deleteTagById():
     return {
-        'Ok': False,
-        'ErrMsg': 'Not Implemented'
-    }, 404
+        'Ok': True,
+        'tag': tag.serialize()
+    }, 200
+
+
+def deleteTag(entry, key):
+    """
+    Delete the tag of a (tagid, name) cache entry
+
+    The collectionXTag rows and the tag are deleted with one statement each,
+    deleting through the ORM would load every tagged collection first
+    """
+    if entry is None:
+        return unknownTag(key)
+
+    try:
+        db.session.execute(collectionXtag.delete()
+                           .where(collectionXtag.c.tagid == entry[0]))
+        db.session.execute(db.delete(Tag).where(Tag.tagid == entry[0])
+                           .execution_options(synchronize_session=False))
+        db.session.commit()
+        tagCache().invalidate({('id', entry[0]), ('name', entry[1])})
+    except Exception as err:
+        db.session.rollback()
+        return {
+            'Ok': False,
+            'ErrMsg': f'Unknown error deleting Tag: {err=}'
+        }, 200
 
-@tag_bp.route('<string:tagName>', methods=['DELETE'])
-def deleteTagByName():
     return {
-        'Ok': False,
-        'ErrMsg': 'Not Implemented'
-    }, 404
+        'Ok': True,
+        'tagId': entry[0]
+    }, 200
+
+
+def chunks(ids):
+    """
+    Split ids into lists of TAG_ASSIGN_CHUNK_SIZE, each applied in its own
+    transaction
+    """
+    size = current_app.config.get('TAG_ASSIGN_CHUNK_SIZE', 1000)
+    return [ids[start:start + size] for start in range(0, len(ids), size)]
+
+
+def assignTag(tagid, collectionids):
+    """
+    Attach the tag to the collections that do not carry it yet with a
+    single INSERT ... SELECT and commit, returning the number of
+    collections tagged
+    """
+    if not collectionids:
+        return 0
+
+    tagged = db.exists().where(
+        collectionXtag.c.tagid == tagid,
+        collectionXtag.c.collectionid == Collection.collectionid)
+    insert = collectionXtag.insert().from_select(
+        ['tagid', 'collectionid'],
+        db.select(db.literal(tagid), Collection.collectionid)
+          .where(Collection.collectionid.in_(collectionids), ~tagged))
+
+    retries = current_app.config.get('TAG_ASSIGN_RETRIES', 3)
+    for attempt in range(retries):
+        try:
+            count = db.session.execute(insert).rowcount
+            countCollections(tagid, count)
+            db.session.commit()
+            return count
+        except IntegrityError:
+            # a concurrent request tagged some of the collections first,
+            # the next attempt skips them
+            db.session.rollback()
+            if attempt == retries - 1:
+                raise
+
+    return 0
+
+
+def countCollections(tagid, change):
+    """
+    Move the collection_count of the tag by change inside the transaction
+    that added or removed its collectionXTag rows
+    """
+    if change:
+        db.session.execute(
+            db.update(Tag).where(Tag.tagid == tagid)
+              .values(collection_count=Tag.collection_count + change)
+              .execution_options(synchronize_session=False))
+
+
+def validateCollectionIds(json):
+    """
+    Check that the posted data holds a list of at most TAG_ASSIGN_MAX_IDS
+    collection ids
+
+    Returns whether the data is valid and either the ids without repeats
+    or the error response
+    """
+    ids = json.get('ids') if isinstance(json, dict) else None
+    if not isinstance(ids, list) or \
+            not all(isinstance(i, int) and not isinstance(i, bool)
+                    for i in ids):
+        return False, {
+            'Ok': False,
+            'ErrMsg': 'ids must be a list of integers'
+        }
+
+    maxIds = current_app.config.get('TAG_ASSIGN_MAX_IDS', 100000)
+    if len(ids) > maxIds:
+        return False, {
+            'Ok': False,
+            'ErrMsg': f'Request exceeds {maxIds} collections'
+        }
+
+    return True, list(dict.fromkeys(ids))
+
+
+def validateTagData(json):
+    """
+    Check that the posted tag data contains a tagName that can be addressed
+    as /tag/<tagName>, a non empty string without surrounding whitespace or
+    a '/' that is not all digits
+
+    Returns whether the data is valid and either the tag name or the error
+    response
+    """
+    if not isinstance(json, dict) or 'tagName' not in json:
+        return False, {
+            'Ok': False,
+            'ErrMsg': 'Tag Name is missing from the request'
+        }
+
+    tagName = json['tagName']
+    if not isinstance(tagName, str) or not tagName.strip():
+        return False, {
+            'Ok': False,
+            'ErrMsg': 'Tag Name must be a non empty string'
+        }
+
+    if tagName != tagName.strip():
+        return False, {
+            'Ok': False,
+            'ErrMsg': 'Tag Name can not start or end with whitespace'
+        }
+
+    if '/' in tagName:
+        return False, {
+            'Ok': False,
+            'ErrMsg': "Tag Name can not contain '/'"
+        }
+
+    if tagName.isdigit():
+        return False, {
+            'Ok': False,
+            'ErrMsg': 'Tag Name can not be a number'
+        }
+
+    return True, tagName
 ## }}}
@@ -0,0 +1,161 @@
+###############################################################################
+#  tagcache.py for archivist card catalog microservice                        #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""
+In process LRU cache resolving tag names and ids
+"""
+# }}}
+
+# tagcache {{{
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy import event, inspect
+from .models import db, Tag
+
+
+class TagCache:
+    """
+    Bounded LRU cache of tags keyed by both name and id
+
+    Entries are (tagid, name) tuples rather than ORM objects so that they can
+    be shared between sessions. Entries are filled on read and dropped when
+    a session of this process commits a change to the tag, changes made by
+    other processes are picked up once the entry expires.
+
+    Keyword arguments:
+    maxsize -- maximum number of keys kept, each tag uses two
+    ttl -- seconds an entry is served for, 0 to keep entries until evicted
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def by_name(self, name):
+        """
+        Return the (tagid, name) of the named tag or None if there is none
+        """
+        return self.lookup(('name', name), Tag.name == name)
+
+    def by_id(self, tagid):
+        """
+        Return the (tagid, name) of the tag with the id or None if there is
+        none
+        """
+        return self.lookup(('id', tagid), Tag.tagid == tagid)
+
+    def lookup(self, key, criteria):
+        """
+        Return the cached entry for key, querying the tag table with
+        criteria on a miss
+        """
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is not None and self.ttl \
+               and cached[0] <= time.monotonic():
+                del self.entries[key]
+                cached = None
+            if cached is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        row = db.session.query(Tag.tagid, Tag.name).filter(criteria).first()
+        if row is None:
+            return None
+
+        entry = (row.tagid, row.name)
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self.lock:
+            for entryKey in (('id', entry[0]), ('name', entry[1])):
+                self.entries[entryKey] = (expires, entry)
+                self.entries.move_to_end(entryKey)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+        return entry
+
+    def invalidate(self, keys):
+        """
+        Drop the given ('id', tagid) / ('name', name) keys
+        """
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        """
+        Drop every entry
+        """
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """
+        Return the cache counters
+        """
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+@event.listens_for(db.session, 'before_flush')
+def collectTagChanges(session, flush_context, instances):  # pylint: disable=unused-argument
+    """
+    Remember the keys of tags written by this flush, including the name a
+    renamed tag had before
+    """
+    keys = session.info.setdefault('tag_cache_keys', set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if not isinstance(obj, Tag):
+            continue
+        keys.add(('id', obj.tagid))
+        keys.add(('name', obj.name))
+        keys.update(('name', name)
+                    for name in inspect(obj).attrs.name.history.deleted)
+
+
+@event.listens_for(db.session, 'after_commit')
+def invalidateTagChanges(session):
+    """
+    Drop the tags changed by the committed transaction from the cache
+    """
+    keys = session.info.pop('tag_cache_keys', None)
+    if keys:
+        current_app.extensions['tag_cache'].invalidate(keys)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discardTagChanges(session):
+    """
+    Forget the tag changes of a rolled back transaction
+    """
+    session.info.pop('tag_cache_keys', None)
+
+# }}}
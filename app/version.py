@@ -21,6 +21,6 @@ version information for the archivist card catalog microservice
 # }}}
 
 # version ## {{{
-VERSION = "0.1"
+VERSION = "0.5"
 APPNAME = "card-catalog"
 # }}}
@@ -32,12 +32,9 @@ if __name__ == "__main__":
     except KeyError:
         print(f"Unknown configuration type {configType}")
 
-    # ingest the run time options from env variables
-    # cfg.dbEngine = os.environ.get('DBEngine')
-    # cfg.dbHost = os.environ.get('DBHost')
-    # cfg.dbName = os.environ.get('DBName')
-    # cfg.dbUser = os.environ.get('DBUser')
-    # cfg.dbPasswd = os.environ.get('DBPasswd')
+    # the PROD configuration ingests the database connection and pool
+    # options (DBEngine, DBHost, DBName, DBUser, DBPasswd, DBPoolSize, ...)
+    # from env variables, see app/config.py
     # cfg.storageLocation = os.environ.get('StorageLocation')
 
     app = create_app(config)
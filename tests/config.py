@@ -36,5 +36,6 @@ class TestConfig(AppConfig):  # pylint: disable=too-few-public-methods
 
     SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_BINDS = {"queue": "sqlite:///:memory:"}
 
 # }}}
@@ -0,0 +1,106 @@
+###############################################################################
+#  test_collectioncache.py for archivist card catalog microservice unit tests #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""
+Unit tests for the collection cache backends
+"""
+# }}}
+
+# test_collectioncache {{{
+import pytest
+from app.appfactory import create_app
+from app.collectioncache import CacheBackend, MemoryCache, collectionKey
+from .config import TestConfig
+
+
+def test_memory_cache_lru():
+    """
+    GIVEN a memory cache holding two entries
+    WHEN a third entry is stored
+    THEN the least recently used entry should be evicted
+    """
+    cache = MemoryCache(maxsize=2, ttl=0)
+    cache.set(collectionKey(1, 1), {'collectionid': 1})
+    cache.set(collectionKey(2, 1), {'collectionid': 2})
+    assert cache.get(collectionKey(1, 1)) == {'collectionid': 1}
+
+    cache.set(collectionKey(3, 1), {'collectionid': 3})
+    assert cache.get(collectionKey(2, 1)) is None
+    assert cache.get(collectionKey(1, 1)) == {'collectionid': 1}
+    assert cache.stats() == {'size': 2, 'maxsize': 2, 'ttl': 0,
+                             'hits': 2, 'misses': 1}
+
+
+def test_memory_cache_ttl(monkeypatch):
+    """
+    GIVEN a memory cache with a ttl
+    WHEN an entry is older than the ttl
+    THEN it should no longer be served
+    """
+    now = [100.0]
+    monkeypatch.setattr('app.collectioncache.time.monotonic',
+                        lambda: now[0])
+    cache = MemoryCache(maxsize=2, ttl=10)
+    cache.set(collectionKey(1, 1), {'collectionid': 1})
+
+    now[0] = 109.0
+    assert cache.get(collectionKey(1, 1)) == {'collectionid': 1}
+    now[0] = 110.0
+    assert cache.get(collectionKey(1, 1)) is None
+    assert cache.stats()['size'] == 0
+
+
+def test_memory_cache_delete():
+    """
+    GIVEN a memory cache holding entries
+    WHEN some keys are deleted
+    THEN only those entries should be dropped
+    """
+    cache = MemoryCache()
+    cache.set(collectionKey(1, 1), {'collectionid': 1})
+    cache.set(collectionKey(1, 2), {'collectionid': 1})
+    cache.delete([collectionKey(1, 1), collectionKey(5, 5)])
+    assert cache.get(collectionKey(1, 1)) is None
+    assert cache.get(collectionKey(1, 2)) == {'collectionid': 1}
+
+def test_incomplete_cache_backend():
+    """
+    GIVEN a collection cache backend missing some of the interface
+    WHEN an application is created with it as COLLECTION_CACHE_CLASS
+    THEN the application should fail to be created
+    """
+    class GetOnlyCache(CacheBackend):  # pylint: disable=too-few-public-methods
+        """
+        Backend implementing only get
+        """
+        def __init__(self, maxsize, ttl):
+            self.maxsize = maxsize
+            self.ttl = ttl
+
+        def get(self, key):
+            return None
+
+    class GetOnlyConfig(TestConfig):  # pylint: disable=too-few-public-methods
+        """
+        Test configuration with the incomplete backend
+        """
+        COLLECTION_CACHE_CLASS = GetOnlyCache
+
+    with pytest.raises(TypeError):
+        create_app(GetOnlyConfig())
+
+# }}}
@@ -0,0 +1,135 @@
+###############################################################################
+#  test_compression.py for archivist card catalog microservice unit tests     #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""
+Unit tests for the response compression
+"""
+# }}}
+
+# test_compression {{{
+import gzip
+import pytest
+from app.appfactory import create_app
+from .config import TestConfig
+
+RECORD_DATA = {
+    "record_type": 1,
+    "title": "Compressible Document",
+    "filename": "Compressible.docx",
+    "extension": "docx",
+    "size": "101kb",
+    "checksum": "2ee20486d3b51eed3f850139af55c7ea",
+    "author": "Me",
+    "user": 1000
+}
+
+
+@pytest.fixture(scope='module', name='test_client')
+def fixture_test_client():
+    """
+    Test client for tests
+    """
+    app = create_app(TestConfig())
+
+    client = app.test_client()
+    ctx = app.app_context()
+    ctx.push()
+    client.post('/init')
+    yield client
+
+    ctx.pop()
+
+
+@pytest.fixture(scope='module', name='collectionid')
+def fixture_collectionid(test_client):
+    """
+    A collection with enough editions for a compressible edition list
+    """
+    collectionid = test_client.post('/shelf', json=RECORD_DATA) \
+                              .json['collectionid']
+    for _ in range(10):
+        test_client.post(f'/shelf/{collectionid}', json=RECORD_DATA)
+    return collectionid
+
+
+def test_compress_gzip(test_client, collectionid):
+    """
+    GIVEN a card catalog service
+    WHEN a large json response is requested with Accept-Encoding gzip
+    THEN the response should be gzip encoded
+    THEN it should decompress to the uncompressed response
+    """
+    url = f'/shelf/{collectionid}/edition'
+    plain = test_client.get(url)
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    resp = test_client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in resp.headers['Vary']
+    assert int(resp.headers['Content-Length']) < len(plain.data)
+    assert gzip.decompress(resp.data) == plain.data
+
+
+def test_compress_brotli(test_client, collectionid):
+    """
+    GIVEN a card catalog service with brotli installed
+    WHEN a large json response is requested accepting brotli and gzip
+    THEN the response should be brotli encoded
+    """
+    brotli = pytest.importorskip('brotli')
+    url = f'/shelf/{collectionid}/edition'
+    plain = test_client.get(url)
+
+    resp = test_client.get(url, headers={'Accept-Encoding': 'gzip, br'})
+    assert resp.headers['Content-Encoding'] == 'br'
+    assert brotli.decompress(resp.data) == plain.data
+
+
+def test_compress_skipped(test_client, collectionid):
+    """
+    GIVEN a card catalog service
+    WHEN a response is below the minimum size
+    WHEN the client refuses every supported encoding
+    THEN the response should not be encoded
+    """
+    resp = test_client.get('/status', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in resp.headers
+
+    resp = test_client.get(f'/shelf/{collectionid}/edition',
+                           headers={'Accept-Encoding': 'gzip;q=0, br;q=0'})
+    assert 'Content-Encoding' not in resp.headers
+    assert resp.json['Ok']
+
+
+def test_compress_stream(test_client, collectionid):
+    """
+    GIVEN a card catalog service
+    WHEN the streamed export is requested with Accept-Encoding gzip
+    THEN the stream should be gzip encoded without a Content-Length
+    THEN it should decompress to the uncompressed export
+    """
+    assert collectionid
+    plain = test_client.get('/shelf/export?editions=1')
+
+    resp = test_client.get('/shelf/export?editions=1',
+                           headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in resp.headers
+    assert gzip.decompress(resp.data) == plain.data
+
+# }}}
@@ -0,0 +1,114 @@
+###############################################################################
+#  test_config.py for archivist card catalog microservice unit tests          #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""
+unit tests for the production configuration
+"""
+# }}}
+
+# test_config {{{
+
+import pytest
+from app.config import ProdConfig
+
+PROD_ENV = {
+    'DBEngine': 'postgresql+psycopg2',
+    'DBHost': 'db.example.com',
+    'DBPort': '5433',
+    'DBName': 'catalog',
+    'DBUser': 'archivist',
+    'DBPasswd': 'secret',
+    'DBPoolSize': '4',
+    'DBMaxOverflow': '8',
+    'DBPoolTimeout': '5',
+    'DBPoolRecycle': '120'
+}
+
+
+@pytest.fixture
+def prod_env(monkeypatch):
+    """
+    Clear the production settings from the environment
+    """
+    for name in PROD_ENV:
+        monkeypatch.delenv(name, raising=False)
+    return monkeypatch
+
+
+def test_prod_config_from_environment(prod_env):
+    """
+    GIVEN the production database settings in the environment
+    WHEN a ProdConfig is created
+    THEN the database uri should be built from the settings
+    THEN the port should be parsed as an int
+    THEN the pool options should be parsed as ints
+    THEN pool_pre_ping should be enabled
+    """
+    for name, value in PROD_ENV.items():
+        prod_env.setenv(name, value)
+
+    config = ProdConfig()
+    uri = config.SQLALCHEMY_DATABASE_URI
+    assert uri.drivername == 'postgresql+psycopg2'
+    assert uri.host == 'db.example.com'
+    assert uri.port == 5433
+    assert uri.database == 'catalog'
+    assert uri.username == 'archivist'
+    assert uri.password == 'secret'
+    assert config.SQLALCHEMY_ENGINE_OPTIONS == {
+        'pool_size': 4,
+        'max_overflow': 8,
+        'pool_timeout': 5,
+        'pool_recycle': 120,
+        'pool_pre_ping': True
+    }
+
+
+def test_prod_config_defaults(prod_env):
+    """
+    GIVEN no production database settings in the environment
+    WHEN a ProdConfig is created
+    THEN the database uri should use the defaults without a port
+    THEN the pool options should use the defaults
+    """
+    config = ProdConfig()
+    uri = config.SQLALCHEMY_DATABASE_URI
+    assert uri.drivername == 'mysql+mysqldb'
+    assert uri.host == 'localhost'
+    assert uri.port is None
+    assert uri.database == 'card-catalog'
+    assert uri.username is None
+    assert config.SQLALCHEMY_ENGINE_OPTIONS == {
+        'pool_size': 10,
+        'max_overflow': 20,
+        'pool_timeout': 30,
+        'pool_recycle': 280,
+        'pool_pre_ping': True
+    }
+
+
+def test_prod_config_invalid_port(prod_env):
+    """
+    GIVEN a DBPort that is not a number
+    WHEN a ProdConfig is created
+    THEN a ValueError should be raised
+    """
+    prod_env.setenv('DBPort', 'mysql')
+    with pytest.raises(ValueError):
+        ProdConfig()
+
+# }}}
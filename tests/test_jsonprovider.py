@@ -0,0 +1,115 @@
+###############################################################################
+#  test_jsonprovider.py for archivist card catalog microservice unit tests    #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""
+unit tests for the json provider
+"""
+# }}}
+
+# test_jsonprovider {{{
+
+import datetime
+import json
+import pytest
+from flask.json.provider import DefaultJSONProvider
+from app.appfactory import create_app
+from app.models import RecordType
+from .config import TestConfig
+
+DATA = {
+    "title": "New Document",
+    "record_type": RecordType.DOCUMENT,
+    "creation_date": datetime.datetime(2023, 1, 2, 3, 4, 5),
+    "editions": [1, 2, 3],
+    "byid": {2: "b", 1: "a"}
+}
+
+
+@pytest.fixture(scope='module', name='app')
+def fixture_app():
+    """
+    Application fixture for unit tests
+    """
+    return create_app(TestConfig())
+
+
+def test_fast_matches_default(app):
+    """
+    GIVEN a card catalog service with orjson installed
+    WHEN data with datetimes, enums and non string keys is serialized
+    THEN the output should match the default flask provider
+    """
+    pytest.importorskip('orjson')
+    assert app.json.fast
+    expected = json.loads(DefaultJSONProvider(app).dumps(DATA))
+    assert json.loads(app.json.dumps(DATA)) == expected
+    assert app.json.loads(app.json.dumps(DATA)) == expected
+
+
+def test_response(app):
+    """
+    GIVEN a card catalog service
+    WHEN a response is built from data
+    THEN the body should be the json of the data
+    THEN the mimetype should be application/json
+    """
+    with app.app_context():
+        resp = app.json.response(DATA)
+
+    assert resp.mimetype == 'application/json'
+    assert json.loads(resp.data) == \
+        json.loads(DefaultJSONProvider(app).dumps(DATA))
+
+
+def test_iso_dates():
+    """
+    GIVEN a card catalog service configured for ISO dates
+    WHEN a datetime is serialized with and without the fast encoder
+    THEN it should be written as ISO 8601
+    """
+    class IsoConfig(TestConfig):  # pylint: disable=too-few-public-methods
+        """
+        ISO date configuration
+        """
+        JSON_ISO_DATES = True
+
+    app = create_app(IsoConfig())
+    assert json.loads(app.json.dumps(DATA))['creation_date'] == \
+        '2023-01-02T03:04:05'
+
+    app.json.fast = False
+    assert json.loads(app.json.dumps(DATA))['creation_date'] == \
+        '2023-01-02T03:04:05'
+
+
+def test_stdlib_fallback():
+    """
+    GIVEN a card catalog service with the fast encoder disabled
+    WHEN data is serialized
+    THEN the output should match the default flask provider
+    """
+    class StdlibConfig(TestConfig):  # pylint: disable=too-few-public-methods
+        """
+        Stdlib json configuration
+        """
+        JSON_FAST_ENCODER = False
+
+    app = create_app(StdlibConfig())
+    assert app.json.fast is False
+    assert app.json.dumps(DATA) == DefaultJSONProvider(app).dumps(DATA)
+
+# }}}
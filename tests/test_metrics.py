@@ -0,0 +1,156 @@
+###############################################################################
+#  test_metrics.py for archivist card catalog microservice unit tests         #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""
+unit tests for the metrics end point
+"""
+# }}}
+
+# test_metrics {{{
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from app.appfactory import create_app
+from app.models import db
+from .config import TestConfig
+
+
+class MetricsConfig(TestConfig):  # pylint: disable=too-few-public-methods
+    """
+    Test configuration with metrics enabled
+    """
+    METRICS_ENABLED = True
+
+
+@pytest.fixture(scope='module', name='test_client')
+def fixture_test_client():
+    """
+    Test client fixture for unit tests
+    """
+    app = create_app(MetricsConfig())
+
+    client = app.test_client()
+    ctx = app.app_context()
+    ctx.push()
+    client.post('/init')
+    yield client
+
+    ctx.pop()
+
+
+def test_metrics(test_client):
+    """
+    GIVEN a card catalog service with metrics enabled
+    WHEN a collection has been read
+    WHEN the GET /metrics page is requested
+    THEN should return 200
+    THEN should return the latency histogram of the read endpoint
+    THEN should return the queries issued by the read endpoint
+    """
+    test_client.get('/shelf/1')
+    test_client.get('/shelf/1')
+
+    resp = test_client.get('/metrics')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/plain'
+
+    lines = resp.data.decode().splitlines()
+    labels = 'endpoint="shelf.getRecord",method="GET"'
+    assert f'catalog_request_duration_seconds_count{{{labels}}} 2' in lines
+    assert f'catalog_request_queries_sum{{{labels}}} 2' in lines
+    assert f'catalog_request_queries_bucket{{{labels},le="1"}} 2' in lines
+    assert any(line.startswith(f'catalog_request_query_seconds_total'
+                               f'{{{labels}}}') for line in lines)
+
+
+def test_metrics_streamed(test_client):
+    """
+    GIVEN a card catalog service with metrics enabled
+    WHEN a streamed response has been sent
+    THEN the queries run while streaming should be counted
+    """
+    resp = test_client.get('/shelf/export?tags=1')
+    assert resp.status_code == 200
+    resp.close()
+
+    lines = test_client.get('/metrics').data.decode().splitlines()
+    labels = 'endpoint="shelf.exportCatalog",method="GET"'
+    assert f'catalog_request_duration_seconds_count{{{labels}}} 1' in lines
+    assert f'catalog_request_queries_sum{{{labels}}} 0' not in lines
+    assert f'catalog_request_queries_bucket{{{labels},le="0"}} 0' in lines
+
+
+def test_metrics_failed_statement():
+    """
+    GIVEN a card catalog service with metrics enabled
+    WHEN a statement raises during a request
+    THEN it should be counted against the request
+    THEN nothing should be left behind on the connection
+    """
+    app = create_app(MetricsConfig())
+    test_client = app.test_client()
+
+    @app.route('/failing')
+    def failing():  # pylint: disable=unused-variable
+        try:
+            db.session.execute(db.text('SELECT * FROM missing_table'))
+        except OperationalError:
+            db.session.rollback()
+        return {'Ok': False}, 200
+
+    test_client.get('/failing')
+    lines = test_client.get('/metrics').data.decode().splitlines()
+    labels = 'endpoint="failing",method="GET"'
+    assert f'catalog_request_queries_sum{{{labels}}} 1' in lines
+    with app.app_context():
+        assert 'metrics_query_start' not in db.session.connection().info
+
+
+def test_metrics_unhandled_exception():
+    """
+    GIVEN a card catalog service with metrics enabled
+    WHEN a request raises after issuing a statement
+    THEN its latency and statements should still be recorded
+    """
+    app = create_app(MetricsConfig())
+    test_client = app.test_client()
+
+    @app.route('/raising')
+    def raising():  # pylint: disable=unused-variable
+        db.session.execute(db.text('SELECT 1'))
+        raise RuntimeError('request failed')
+
+    with pytest.raises(RuntimeError):
+        test_client.get('/raising')
+
+    lines = test_client.get('/metrics').data.decode().splitlines()
+    labels = 'endpoint="raising",method="GET"'
+    assert f'catalog_request_duration_seconds_count{{{labels}}} 1' in lines
+    assert f'catalog_request_queries_sum{{{labels}}} 1' in lines
+
+
+def test_metrics_disabled():
+    """
+    GIVEN a card catalog service with metrics disabled
+    WHEN the GET /metrics page is requested
+    THEN should return 404
+    """
+    app = create_app(TestConfig())
+    resp = app.test_client().get('/metrics')
+    assert resp.status_code == 404
+
+# }}}
@@ -0,0 +1,145 @@
+###############################################################################
+#  test_migrations.py for archivist card catalog microservice unit tests      #
+#  Copyright (c) 2023 Tom Hartman (thomas.lees.hartman@gmail.com)             #
+#                                                                             #
+#  This program is free software; you can redistribute it and/or              #
+#  modify it under the terms of the GNU General Public License                #
+#  as published by the Free Software Foundation; either version 2             #
+#  of the License, or the License, or (at your option) any later              #
+#  version.                                                                   #
+#                                                                             #
+#  This program is distributed in the hope that it will be useful,            #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of             #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the              #
+#  GNU General Public License for more details.                               #
+###############################################################################
+
+# Commentary {{{
+"""
+Unit tests for the schema migrations
+"""
+# }}}
+
+# test_migrations {{{
+import pytest
+from sqlalchemy import inspect
+from app.appfactory import create_app
+from app.models import db, Shelf, Tag
+from app.models.tags import collectionXtag
+from app.migrations import MIGRATIONS, versionKey
+from app.version import VERSION
+from .config import TestConfig
+
+# the schema as created before migrations existed
+BASELINE_SCHEMA = [
+    "CREATE TABLE card_catalog (id INTEGER PRIMARY KEY, "
+    "name VARCHAR(100) NOT NULL, version VARCHAR(25) NOT NULL, "
+    "install_date DATETIME DEFAULT CURRENT_TIMESTAMP)",
+    "CREATE TABLE collection (collectionid INTEGER PRIMARY KEY, "
+    "current_edition INTEGER NOT NULL, "
+    "creation_date DATETIME DEFAULT CURRENT_TIMESTAMP, "
+    "creation_user INTEGER NOT NULL, "
+    "modified_date DATETIME DEFAULT CURRENT_TIMESTAMP, "
+    "modified_user INTEGER NOT NULL)",
+    "CREATE TABLE shelf (recordid INTEGER PRIMARY KEY, "
+    "collectionid INTEGER REFERENCES collection (collectionid), "
+    "edition INTEGER NOT NULL, record_type INTEGER NOT NULL, "
+    "title VARCHAR(255) NOT NULL, filename VARCHAR(255) NOT NULL, "
+    "extension VARCHAR(10) NOT NULL, size VARCHAR(100) NOT NULL, "
+    "author VARCHAR(255) NOT NULL, checksum VARCHAR(64) NOT NULL, "
+    "creation_date DATETIME DEFAULT CURRENT_TIMESTAMP, "
+    "creation_user INTEGER NOT NULL)",
+    "CREATE TABLE tag (tagid INTEGER PRIMARY KEY AUTOINCREMENT, "
+    "name VARCHAR(100) NOT NULL)",
+    'CREATE TABLE "collectionXTag" ('
+    "tagid INTEGER REFERENCES tag (tagid), "
+    "collectionid INTEGER REFERENCES collection (collectionid))",
+    "INSERT INTO card_catalog (name, version) VALUES ('card-catalog', '0.1')",
+    "INSERT INTO collection (current_edition, creation_user, modified_user) "
+    "VALUES (2, 1000, 1000)",
+    "INSERT INTO shelf (collectionid, edition, record_type, title, filename, "
+    "extension, size, author, checksum, creation_user) VALUES "
+    "(1, 1, 1, 'Old Ledger', 'ledger.txt', 'txt', '1kb', 'Me', 'a', 1000), "
+    "(1, 2, 1, 'Annual Ledger', 'ledger.txt', 'txt', '2kb', 'Me', 'b', 1000),"
+    "(1, 3, 1, 'Unsized', 'unsized.txt', 'txt', 'big', 'Me', 'c', 1000)",
+    "INSERT INTO tag (name) VALUES ('ledgers'), ('unused')",
+    'INSERT INTO "collectionXTag" VALUES (1, 1), (1, 1), (1, 1)'
+]
+
+
+class MigrationConfig(TestConfig):  # pylint: disable=too-few-public-methods
+    """
+    Test configuration backfilling in small batches
+    """
+    MIGRATION_BATCH_SIZE = 2
+
+
+@pytest.fixture(scope='module', name='test_client')
+def fixture_test_client():
+    """
+    Test client on a database holding the baseline schema
+    """
+    app = create_app(MigrationConfig())
+
+    client = app.test_client()
+    ctx = app.app_context()
+    ctx.push()
+    conn = db.session.connection()
+    for statement in BASELINE_SCHEMA:
+        conn.exec_driver_sql(statement)
+    db.session.commit()
+    yield client
+
+    ctx.pop()
+
+
+def test_migrations_ordered():
+    """
+    GIVEN the list of migrations
+    THEN the versions should be increasing and end at the current version
+    """
+    versions = [versionKey(migration.version) for migration in MIGRATIONS]
+    assert versions == sorted(set(versions))
+    assert MIGRATIONS[-1].version == VERSION
+
+
+def test_init_migrates_baseline(test_client):
+    """
+    GIVEN a card catalog service
+    WHEN the database holds the baseline schema and records
+    WHEN the POST /init page is requested
+    THEN every migration should be applied in order
+    THEN the indexes, full-text index and byte sizes should be in place
+    WHEN the POST /init page is requested again
+    THEN the database should be reported as initialized
+    """
+    resp = test_client.post('/init')
+    assert resp.json['Ok']
+    assert resp.json['migrations'] == [m.version for m in MIGRATIONS]
+    assert resp.json['response']['version'] == VERSION
+
+    inspector = inspect(db.session.connection())
+    indexes = {index['name'] for index in inspector.get_indexes('shelf')}
+    assert {index.name for index in Shelf.__table__.indexes} <= indexes
+
+    sizes = db.session.query(Shelf.edition, Shelf.size_bytes) \
+                      .order_by(Shelf.edition).all()
+    assert sizes == [(1, 1024), (2, 2048), (3, None)]
+    assert db.session.query(collectionXtag).count() == 1
+    assert db.session.query(Tag.name, Tag.collection_count) \
+                     .order_by(Tag.tagid).all() == [('ledgers', 1),
+                                                    ('unused', 0)]
+
+    resp = test_client.get('/shelf/search?q=ledger')
+    assert [c['edition']['title'] for c in resp.json['collections']] == \
+        ['Annual Ledger']
+
+    resp = test_client.post('/init')
+    assert resp.json['Ok'] is False
+    assert resp.json['ErrMsg'] == \
+        f'Database already initialized with version {VERSION}'
+
+    assert test_client.get('/status?fresh=1').json['database']['version'] \
+        == VERSION
+
+# }}}
@@ -21,11 +21,17 @@ Unit tests for the shelf routes
 # }}}
 
 # test_shelf {{{
+import json
 import random
+import threading
 import pytest
+from sqlalchemy import event
+from app import ingest
 from app.appfactory import create_app
-from app.models import RecordType
-from app.routes.shelf import validateRecordData, required_fields
+from app.models import db, RecordType, Collection, Shelf, Tag, IngestJob
+from app.models.shelf import parse_size, backfill_size_bytes
+from app.routes.shelf import validateRecordData, required_fields, \
+    shelveEdition
 from .config import TestConfig
 
 CHECKSUM = '2ee20486d3b51eed3f850139af55c7ea'
@@ -69,6 +75,20 @@ def fixture_with_collection(test_client):
     return resp.json['collection']
 
 
+@pytest.fixture(scope='function', name='ingest_queue')
+def fixture_ingest_queue(test_client, monkeypatch):
+    """
+    Ingest queue with a worker configured but stopped, the test drains it
+    """
+    queue = test_client.application.extensions['ingest_queue']
+    monkeypatch.setattr(queue, 'workers', 1)
+    monkeypatch.setattr(queue, 'threads', [])
+    monkeypatch.setattr(queue, 'stopped', threading.Event())
+    monkeypatch.setattr(queue, 'wakeup', threading.Event())
+    queue.stop()
+    return queue
+
+
 #################
 # Enpoint Tests #
 #################
@@ -87,6 +107,248 @@ def test_add_collection(test_client):
     assert isinstance(resp.json['collectionid'], int)
 
 
+def test_add_collection_bulk(test_client):
+    """
+    GIVEN a card catalog service
+    WHEN POST /shelf/bulk is invoked
+    WHEN a list of valid records is provided
+    THEN the response should be 200
+    THEN Ok is True
+    THEN each result should contain the new collection id
+    THEN each new collection should be readable
+    """
+    records = []
+    for i in range(5):
+        record = GOOD_RECORD_DATA.copy()
+        record['title'] = "BulkDocument" + str(i)
+        records.append(record)
+
+    resp = test_client.post('/shelf/bulk', json=records)
+    assert resp.status_code == 200
+    assert resp.json['Ok']
+    assert len(resp.json['results']) == len(records)
+
+    for i, result in enumerate(resp.json['results']):
+        assert result['Ok']
+        assert result['index'] == i
+        collection = test_client.get(f"/shelf/{result['collectionid']}")
+        assert collection.json['collection']['edition']['title'] == \
+            "BulkDocument" + str(i)
+
+
+def test_add_collection_bulk_statements(test_client):
+    """
+    GIVEN a card catalog service
+    WHEN POST /shelf/bulk is invoked with several records
+    THEN the shelf rows should be inserted with a single executemany
+    THEN the new collections should not be read back after the commit
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):  # pylint: disable=too-many-arguments
+        statements.append((statement.split()[0], statement, executemany))
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        resp = test_client.post('/shelf/bulk', json=[GOOD_RECORD_DATA] * 3)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert all(result['Ok'] for result in resp.json['results'])
+    shelfInserts = [s for s in statements
+                    if s[0] == 'INSERT' and 'INTO shelf' in s[1]]
+    assert len(shelfInserts) == 1 and shelfInserts[0][2]
+    assert not [s for s in statements
+                if s[0] == 'SELECT' and 'FROM collection' in s[1]]
+
+
+def test_add_collection_bulk_ndjson(test_client):
+    """
+    GIVEN a card catalog service
+    WHEN POST /shelf/bulk is invoked
+    WHEN the records are sent as newline delimited json
+    WHEN one of the records is not valid
+    THEN the response should be 200
+    THEN Ok is True
+    THEN only the valid records should be shelved
+    """
+    bad_record = GOOD_RECORD_DATA.copy()
+    bad_record.pop('title')
+    lines = [json.dumps(GOOD_RECORD_DATA), json.dumps(bad_record),
+             'not json', json.dumps(GOOD_RECORD_DATA)]
+
+    resp = test_client.post('/shelf/bulk', data='\n'.join(lines),
+                            content_type='application/x-ndjson')
+    assert resp.status_code == 200
+    assert resp.json['Ok']
+
+    results = resp.json['results']
+    assert [result['Ok'] for result in results] == [True, False, False, True]
+    assert results[1]['ErrMsg'][0] == "Missing title field"
+    assert results[2]['ErrMsg'][0] == "Record data is not a dictionary"
+    assert results[0]['collectionid'] != results[3]['collectionid']
+
+
+def test_add_collection_bulk_not_list(test_client):
+    """
+    GIVEN a card catalog service
+    WHEN POST /shelf/bulk is invoked
+    WHEN the payload is not a list
+    THEN the response should be 200
+    THEN Ok is False
+    """
+    resp = test_client.post('/shelf/bulk', json=GOOD_RECORD_DATA)
+    assert resp.status_code == 200
+    assert resp.json['Ok'] is False
+
+
+def test_add_collection_async(test_client, ingest_queue):
+    """
+    GIVEN a card catalog service
+    WHEN POST /shelf?async=1 is invoked
+    WHEN records information is provided
+    THEN the response should be 200
+    THEN Ok is True
+    THEN a queued job id should be returned
+    WHEN the queue has been drained
+    THEN GET /shelf/jobs/{id} should return the new collection id
+    """
+    resp = test_client.post('/shelf?async=1', json=GOOD_RECORD_DATA)
+    assert resp.status_code == 200
+    assert resp.json['Ok']
+    assert resp.json['state'] == 'queued'
+    jobid = resp.json['jobid']
+
+    resp = test_client.get(f'/shelf/jobs/{jobid}')
+    assert resp.json['Ok']
+    assert resp.json['job']['state'] == 'queued'
+
+    assert ingest_queue.drain() == 1
+
+    resp = test_client.get(f'/shelf/jobs/{jobid}')
+    assert resp.json['job']['state'] == 'done'
+    collectionid = resp.json['job']['collectionid']
+    resp = test_client.get(f'/shelf/{collectionid}')
+    assert resp.json['Ok']
+    assert resp.json['collection']['edition']['title'] == \
+        GOOD_RECORD_DATA['title']
+
+
+def test_add_collection_async_no_workers(test_client):
+    """
+    GIVEN a card catalog service without ingest workers
+    WHEN POST /shelf?async=1 is invoked
+    THEN the record should be shelved inside the request
+    THEN no job should be queued
+    """
+    resp = test_client.post('/shelf?async=1', json=GOOD_RECORD_DATA)
+    assert resp.status_code == 200
+    assert resp.json['Ok']
+    assert isinstance(resp.json['collectionid'], int)
+    assert 'jobid' not in resp.json
+
+
+def test_add_edition_async(test_client, with_collection, ingest_queue):
+    """
+    GIVEN a card catalog service
+    WHEN a collection i exists
+    WHEN POST /shelf/{i}?async=1 and POST /shelf/{j}?async=1 are invoked
+    WHEN collection j does not exist
+    WHEN the queue has been drained
+    THEN the job for i should be done with the new edition
+    THEN the job for j should have failed
+    """
+    collectionid = with_collection['collectionid']
+    jobid = test_client.post(f'/shelf/{collectionid}?async=1',
+                             json=GOOD_RECORD_DATA).json['jobid']
+    badid = test_client.post('/shelf/100000?async=1',
+                             json=GOOD_RECORD_DATA).json['jobid']
+
+    assert ingest_queue.drain() == 2
+
+    job = test_client.get(f'/shelf/jobs/{jobid}').json['job']
+    assert job['state'] == 'done'
+    assert job['collectionid'] == collectionid
+    assert job['edition'] == with_collection['current_edition'] + 1
+
+    job = test_client.get(f'/shelf/jobs/{badid}').json['job']
+    assert job['state'] == 'failed'
+    assert job['error'] == 'Unknown collection 100000'
+
+
+def test_ingest_batch_outcomes(test_client, ingest_queue):
+    """
+    GIVEN a card catalog service
+    WHEN several records have been queued
+    WHEN the queue has been drained
+    THEN the job outcomes should be written with a single update
+    """
+    jobids = [test_client.post('/shelf?async=1', json=GOOD_RECORD_DATA)
+                         .json['jobid'] for _ in range(3)]
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):  # pylint: disable=too-many-arguments
+        statements.append(statement.split()[0])
+
+    engine = db.engines['queue']
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        assert ingest_queue.drain() == 3
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    # one update claims the batch and one records its outcomes
+    assert statements.count('UPDATE') == 2
+    for jobid in jobids:
+        job = test_client.get(f'/shelf/jobs/{jobid}').json['job']
+        assert job['state'] == 'done'
+        assert job['modified_date'] is not None
+
+
+def test_ingest_edition_outcomes(test_client, with_collection, ingest_queue,
+                                 monkeypatch):
+    """
+    GIVEN a card catalog service
+    WHEN several editions have been queued
+    WHEN the queue has been drained
+    THEN each edition job should be recorded as done before the next
+         edition is shelved
+    """
+    collectionid = with_collection['collectionid']
+    jobids = [test_client.post(f'/shelf/{collectionid}?async=1',
+                               json=GOOD_RECORD_DATA).json['jobid']
+              for _ in range(3)]
+    states = []
+
+    def recordStates(*args):
+        states.append([state for (state,) in
+                       db.session.query(IngestJob.state)
+                         .filter(IngestJob.jobid.in_(jobids))
+                         .order_by(IngestJob.jobid)])
+        return shelveEdition(*args)
+
+    monkeypatch.setattr(ingest, 'shelveEdition', recordStates)
+    assert ingest_queue.drain() == 3
+    assert states == [['processing', 'processing', 'processing'],
+                      ['done', 'processing', 'processing'],
+                      ['done', 'done', 'processing']]
+
+
+
+def test_get_job_unknown(test_client):
+    """
+    GIVEN a card catalog service
+    WHEN GET /shelf/jobs/{id} is invoked
+    WHEN the job does not exist
+    THEN the response should be 200
+    THEN Ok is False
+    """
+    resp = test_client.get('/shelf/jobs/100000')
+    assert resp.status_code == 200
+    assert resp.json['Ok'] is False
+    assert resp.json['ErrMsg'] == 'Unknown job 100000'
+
+
 def test_read_collection(test_client, with_collection):
     """
     GIVEN a card catalog service
@@ -128,6 +390,184 @@ def test_read_collection_bad_id(test_client):
     assert resp.json['ErrMsg'] == 'Unknown collection 1000'
 
 
+def test_read_collection_current_edition(test_client, with_collection):
+    """
+    GIVEN a card catalog service
+    WHEN a collection i exists
+    WHEN the collection has n editions
+    WHEN GET /shelf/{i} is invoked
+    THEN the response should be 200
+    THEN Ok is True
+    THEN the edition returned should be edition n
+    """
+    collectionid = with_collection['collectionid']
+    edition_count = random.randint(3, 10)
+
+    for i in range(2, edition_count + 1):
+        new_edition = GOOD_RECORD_DATA.copy()
+        new_edition['title'] = "NewDocumentEdition" + str(i)
+        test_client.post(f'/shelf/{collectionid}', json=new_edition)
+
+    resp = test_client.get(f'/shelf/{collectionid}')
+    assert resp.status_code == 200
+    assert resp.json['Ok']
+    assert resp.json['collection']['current_edition'] == edition_count
+    assert resp.json['collection']['edition']['edition'] == edition_count
+    assert resp.json['collection']['edition']['title'] == \
+        "NewDocumentEdition" + str(edition_count)
+
+
+def test_read_collection_fields(test_client, with_collection):
+    """
+    GIVEN a card catalog service
+    WHEN a collection i exists
+    WHEN GET /shelf/{i}, /shelf/{i}/edition and /shelf/{i}/edition/1 are
+         invoked with fields
+    THEN the response should be 200
+    THEN Ok is True
+    THEN the editions should only contain the requested fields
+    """
+    collectionid = with_collection['collectionid']
+    fields = ['title', 'filename', 'checksum', 'edition']
+
+    resp = test_client.get(f'/shelf/{collectionid}?fields={",".join(fields)}')
+    assert resp.status_code == 200
+    assert resp.json['Ok']
+    assert resp.json['collection']['collectionid'] == collectionid
+    assert resp.json['collection']['edition'] == {
+        'title': GOOD_RECORD_DATA['title'],
+        'filename': GOOD_RECORD_DATA['filename'],
+        'checksum': GOOD_RECORD_DATA['checksum'],
+        'edition': 1
+    }
+
+    resp = test_client.get(f'/shelf/{collectionid}/edition?fields=title')
+    assert resp.json['Ok']
+    assert resp.json['editions'] == [{'title': GOOD_RECORD_DATA['title']}]
+
+    resp = test_client.get(f'/shelf/{collectionid}/edition/1'
+                           '?fields=collectionid,size')
+    assert resp.json['Ok']
+    assert resp.json['edition'] == {'collectionid': collectionid,
+                                    'size': GOOD_RECORD_DATA['size']}
+
+
+def test_read_collection_unknown_fields(test_client, with_collection):
+    """
+    GIVEN a card catalog service
+    WHEN a collection i exists
+    WHEN GET /shelf/{i} is invoked with a field that does not exist
+    THEN the response should be 200
+    THEN Ok is False
+    THEN the error message should be correct
+    """
+    collectionid = with_collection['collectionid']
+    resp = test_client.get(f'/shelf/{collectionid}?fields=title,foo')
+    assert resp.status_code == 200
+    assert resp.json['Ok'] is False
+    assert resp.json['ErrMsg'] == 'Unknown fields foo'
+
+
+def test_read_collection_not_modified(test_client, with_collection):
+    """
+    GIVEN a card catalog service
+    WHEN a collection i exists
+    WHEN the GET /shelf/{i} is invoked with the ETag of a previous read
+    THEN the status code should be 304
+    THEN the ETag should change once an edition is added
+    """
+    collectionid = with_collection['collectionid']
+    resp = test_client.get(f'/shelf/{collectionid}')
+    etag = resp.headers['ETag']
+    assert resp.status_code == 200
+    assert resp.headers['Last-Modified']
+
+    resp = test_client.get(f'/shelf/{collectionid}',
+                           headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert resp.headers['ETag'] == etag
+    assert resp.data == b''
+
+    resp = test_client.get(f'/shelf/{collectionid}?fields=title',
+                           headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+
+    test_client.post(f'/shelf/{collectionid}', json=GOOD_RECORD_DATA)
+    resp = test_client.get(f'/shelf/{collectionid}',
+                           headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != etag
+
+
+def test_read_collection_modified_since(test_client, with_collection):
+    """
+    GIVEN a card catalog service
+    WHEN a collection i exists
+    WHEN the GET /shelf/{i} is invoked with If-Modified-Since
+    THEN the status code should be 304 if the collection is unchanged since
+    THEN the status code should be 200 otherwise
+    """
+    collectionid = with_collection['collectionid']
+    resp = test_client.get(f'/shelf/{collectionid}')
+    lastModified = resp.headers['Last-Modified']
+
+    resp = test_client.get(f'/shelf/{collectionid}',
+                           headers={'If-Modified-Since': lastModified})
+    assert resp.status_code == 304
+
+    resp = test_client.get(f'/shelf/{collectionid}', headers={
+        'If-Modified-Since': 'Sat, 01 Jan 2000 00:00:00 GMT'})
+    assert resp.status_code == 200
+    assert resp.json['Ok']
+
+
+def test_read_collection_cached(test_client, with_collection):
+    """
+    GIVEN a card catalog service
+    WHEN a collection i has been read
+    WHEN the GET /shelf/{i} is invoked again
+    THEN the collection should be served from the collection cache
+    WHEN the collection is changed and committed
+    THEN the changed collection should be returned
+    """
+    collectionid = with_collection['collectionid']
+    cache = test_client.application.extensions['collection_cache']
+    hits = cache.stats()['hits']
+
+    resp = test_client.get(f'/shelf/{collectionid}?fields=title')
+    assert resp.json['collection']['edition'] == {
+        'title': GOOD_RECORD_DATA['title']}
+    assert cache.stats()['hits'] == hits + 1
+
+    collection = db.session.get(Collection, collectionid)
+    collection.modified_user = 4242
+    db.session.commit()
+
+    resp = test_client.get(f'/shelf/{collectionid}')
+    assert resp.json['collection']['modified_user'] == 4242
+    assert resp.json['collection']['edition'] == with_collection['edition']
+    assert cache.stats()['hits'] == hits + 1
+
+
+def test_read_editions_not_modified(test_client, with_collection):
+    """
+    GIVEN a card catalog service
+    WHEN a collection i exists
+    WHEN the GET /shelf/{i}/edition and /shelf/{i}/edition/{j} are invoked
+    WHEN the request carries the ETag of a previous read
+    THEN the status code should be 304
+    """
+    collectionid = with_collection['collectionid']
+    editionid = with_collection['current_edition']
+    for url in (f'/shelf/{collectionid}/edition',
+                f'/shelf/{collectionid}/edition/{editionid}'):
+        resp = test_client.get(url)
+        assert resp.status_code == 200
+        resp = test_client.get(url, headers={
+            'If-None-Match': resp.headers['ETag']})
+        assert resp.status_code == 304
+
+
 def test_add_edition(test_client, with_collection):
     """
     GIVEN a card catalog service
@@ -189,6 +629,38 @@ def test_add_edition_multiple(test_client, with_collection):
         assert resp.json['collection']['edition']['title'] == new_title
 
 
+def test_add_edition_taken_number(test_client, with_collection):
+    """
+    GIVEN a card catalog service
+    WHEN a collection i exists with current edition n
+    WHEN edition n + 1 has already been written by another writer
+    WHEN the POST /shelf/{i} is invoked
+    THEN the response should be 200
+    THEN Ok should be True
+    THEN the new edition should be n + 2
+    THEN there should be no duplicate edition numbers
+    """
+    collectionid = with_collection['collectionid']
+    current_edition = with_collection['current_edition']
+
+    record = GOOD_RECORD_DATA.copy()
+    record['creation_user'] = record.pop('user')
+    db.session.add(Shelf(**record, collectionid=collectionid,
+                         edition=current_edition + 1))
+    db.session.commit()
+
+    resp = test_client.post(f'/shelf/{collectionid}', json=GOOD_RECORD_DATA)
+    assert resp.status_code == 200
+    assert resp.json['Ok']
+    assert resp.json['collection']['current_edition'] == current_edition + 2
+    assert resp.json['collection']['edition']['edition'] == \
+        current_edition + 2
+
+    resp = test_client.get(f'/shelf/{collectionid}/edition')
+    editions = [e['edition'] for e in resp.json['editions']]
+    assert editions == [1, 2, 3]
+
+
 def test_add_edition_bad_collection(test_client):
     """
     GIVEN a card catalog service
@@ -258,6 +730,54 @@ def test_get_edition_multiple(test_client, with_collection):
     assert len(resp.json['editions']) == edition_count - 1
 
 
+def test_get_edition_paginated(test_client, with_collection):
+    """
+    GIVEN a card catalog service
+    WHEN a collection i does exist
+    WHEN the collection has n editions
+    WHEN the GET /shelf/{i}/edition is invoked with a limit
+    THEN the response should be 200
+    THEN Ok should be True
+    THEN Count should be n
+    THEN following next_after_edition should return every edition once
+    """
+    collectionid = with_collection['collectionid']
+    edition_count = 7
+
+    for i in range(2, edition_count + 1):
+        new_edition = GOOD_RECORD_DATA.copy()
+        new_edition['title'] = "NewDocumentEdition" + str(i)
+        test_client.post(f'/shelf/{collectionid}', json=new_edition)
+
+    editions = []
+    after_edition = 0
+    while after_edition is not None:
+        resp = test_client.get(f'/shelf/{collectionid}/edition'
+                               f'?after_edition={after_edition}&limit=3')
+        assert resp.status_code == 200
+        assert resp.json['Ok']
+        assert resp.json['Count'] == edition_count
+        assert len(resp.json['editions']) <= 3
+        editions.extend(e['edition'] for e in resp.json['editions'])
+        after_edition = resp.json['next_after_edition']
+
+    assert editions == list(range(1, edition_count + 1))
+
+
+def test_get_edition_bad_limit(test_client, with_collection):
+    """
+    GIVEN a card catalog service
+    WHEN a collection i does exist
+    WHEN the GET /shelf/{i}/edition is invoked with a limit of 0
+    THEN the response should be 200
+    THEN Ok should be False
+    """
+    collectionid = with_collection['collectionid']
+    resp = test_client.get(f'/shelf/{collectionid}/edition?limit=0')
+    assert resp.status_code == 200
+    assert resp.json['Ok'] is False
+
+
 def test_get_edition_bad_collection(test_client):
     """
     GIVEN a card catalog service
@@ -275,6 +795,381 @@ def test_get_edition_bad_collection(test_client):
     assert resp.json['ErrMsg'] == 'Unknown collection 2000'
 
 
+def test_export(test_client, with_collection):
+    """
+    GIVEN a card catalog service
+    WHEN a collection i exists
+    WHEN the GET /shelf/export is invoked
+    THEN the response should be 200
+    THEN the response should be newline delimited json
+    THEN there should be one line per collection in collectionid order
+    THEN each line should contain the current edition
+    """
+    collectionid = with_collection['collectionid']
+    resp = test_client.get('/shelf/export')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'application/x-ndjson'
+
+    lines = [json.loads(line) for line in resp.data.splitlines()]
+    ids = [line['collectionid'] for line in lines]
+    assert ids == sorted(ids)
+    assert collectionid in ids
+
+    line = lines[ids.index(collectionid)]
+    assert line['edition']['edition'] == line['current_edition']
+    assert 'editions' not in line
+    assert 'tags' not in line
+
+
+def test_export_editions_and_tags(test_client, with_collection):
+    """
+    GIVEN a card catalog service
+    WHEN a collection i exists with n editions and a tag
+    WHEN the GET /shelf/export?editions=1&tags=1 is invoked
+    THEN the response should be 200
+    THEN the line for i should contain all n editions
+    THEN the line for i should contain its tag
+    """
+    collectionid = with_collection['collectionid']
+    for i in range(2, 4):
+        new_edition = GOOD_RECORD_DATA.copy()
+        new_edition['title'] = "NewDocumentEdition" + str(i)
+        test_client.post(f'/shelf/{collectionid}', json=new_edition)
+
+    tag = Tag(name='ExportTag')
+    collection = db.session.get(Collection, collectionid)
+    collection.tags.append(tag)
+    db.session.commit()
+
+    resp = test_client.get('/shelf/export?editions=1&tags=1')
+    assert resp.status_code == 200
+
+    lines = {line['collectionid']: line for line in
+             map(json.loads, resp.data.splitlines())}
+    line = lines[collectionid]
+    assert [e['edition'] for e in line['editions']] == [1, 2, 3]
+    assert line['edition']['edition'] == 3
+    assert line['tags'] == [{'tagid': tag.tagid, 'name': 'ExportTag'}]
+    assert all(line['tags'] == [] for cid, line in lines.items()
+               if cid != collectionid)
+
+
+def test_find_collections_by_tag(test_client):
+    """
+    GIVEN a card catalog service
+    WHEN collections are tagged with tags a and b
+    WHEN the GET /shelf?tag=a&tag=b is invoked
+    THEN the response should be 200
+    THEN Ok should be True
+    THEN only collections tagged with both a and b should be returned
+    WHEN match=any is passed
+    THEN collections tagged with either a or b should be returned
+    """
+    tag_a = Tag(name='SearchTagA')
+    tag_b = Tag(name='SearchTagB')
+    ids = test_client.post('/shelf/bulk',
+                           json=[GOOD_RECORD_DATA] * 3).json['results']
+    ids = [result['collectionid'] for result in ids]
+    both, only_a, only_b = [db.session.get(Collection, i) for i in ids]
+    both.tags.extend([tag_a, tag_b])
+    only_a.tags.append(tag_a)
+    only_b.tags.append(tag_b)
+    db.session.commit()
+
+    resp = test_client.get('/shelf?tag=SearchTagA&tag=SearchTagB')
+    assert resp.status_code == 200
+    assert resp.json['Ok']
+    assert [c['collectionid'] for c in resp.json['collections']] == [ids[0]]
+    assert resp.json['collections'][0]['edition']['edition'] == 1
+
+    resp = test_client.get('/shelf?tag=SearchTagA&tag=SearchTagB&match=any')
+    assert [c['collectionid'] for c in resp.json['collections']] == ids
+
+    resp = test_client.get('/shelf?tag=SearchTagA&tag=Unknown')
+    assert resp.json['Ok']
+    assert resp.json['collections'] == []
+
+
+def test_find_collections_by_tag_paginated(test_client):
+    """
+    GIVEN a card catalog service
+    WHEN n collections are tagged with tag a
+    WHEN the GET /shelf?tag=a is invoked with a limit
+    THEN following next_after_collectionid should return every collection
+    """
+    tag = Tag(name='SearchTagPaged')
+    ids = test_client.post('/shelf/bulk',
+                           json=[GOOD_RECORD_DATA] * 5).json['results']
+    ids = [result['collectionid'] for result in ids]
+    collections = [db.session.get(Collection, i) for i in ids]
+    for collection in collections:
+        collection.tags.append(tag)
+    db.session.commit()
+
+    found = []
+    after = 0
+    while after is not None:
+        resp = test_client.get('/shelf?tag=SearchTagPaged&limit=2'
+                               f'&after_collectionid={after}')
+        assert resp.json['Ok']
+        assert len(resp.json['collections']) <= 2
+        found.extend(c['collectionid'] for c in resp.json['collections'])
+        after = resp.json['next_after_collectionid']
+
+    assert found == ids
+
+
+def test_find_collections_no_tag(test_client):
+    """
+    GIVEN a card catalog service
+    WHEN the GET /shelf is invoked without a tag
+    THEN the response should be 200
+    THEN Ok should be False
+    """
+    resp = test_client.get('/shelf')
+    assert resp.status_code == 200
+    assert resp.json['Ok'] is False
+    assert resp.json['ErrMsg'] == 'At least one tag is required'
+
+
+def test_batch_collections(test_client, with_collection):
+    """
+    GIVEN a card catalog service
+    WHEN collections i and j exist and k does not
+    WHEN the POST /shelf/batch is invoked with i, j and k
+    THEN the collections should be returned keyed by id
+    THEN k should be reported missing
+    WHEN the GET /shelf?ids= is invoked with the same ids
+    THEN the response should be the same
+    """
+    first = with_collection['collectionid']
+    second = test_client.post('/shelf', json=GOOD_RECORD_DATA) \
+                        .json['collectionid']
+    missing = 100000
+
+    resp = test_client.post('/shelf/batch',
+                            json={'ids': [first, second, missing, first]})
+    assert resp.status_code == 200
+    assert resp.json['Ok']
+    assert resp.json['missing'] == [missing]
+    assert list(resp.json['collections']) == [str(first), str(second)]
+    assert resp.json['collections'][str(first)] == with_collection
+
+    batch = resp.json
+    resp = test_client.get(f'/shelf?ids={first},{second},{missing}')
+    assert resp.json == batch
+
+    resp = test_client.get(f'/shelf?ids={first}&fields=title')
+    assert resp.json['collections'][str(first)]['edition'] == {
+        'title': GOOD_RECORD_DATA['title']}
+
+
+def test_batch_collections_bad_ids(test_client):
+    """
+    GIVEN a card catalog service
+    WHEN the batch read is invoked without a list of integer ids
+    WHEN the batch read exceeds SHELF_BATCH_MAX ids
+    THEN Ok should be False
+    """
+    for resp in (test_client.post('/shelf/batch', json={'ids': ['a']}),
+                 test_client.post('/shelf/batch', json=[1, 2]),
+                 test_client.get('/shelf?ids=1,x')):
+        assert resp.json['Ok'] is False
+        assert resp.json['ErrMsg'] == 'ids must be a list of integers'
+
+    maxIds = test_client.application.config['SHELF_BATCH_MAX']
+    resp = test_client.post('/shelf/batch',
+                            json={'ids': list(range(maxIds + 1))})
+    assert resp.json['Ok'] is False
+    assert resp.json['ErrMsg'] == f'Batch exceeds {maxIds} collections'
+
+
+def test_shelf_stats(test_client):
+    """
+    GIVEN a card catalog service
+    WHEN records are shelved with sizes
+    WHEN the GET /shelf/stats is invoked
+    THEN the counts and byte totals should be grouped by record_type,
+         extension and creation_user
+    THEN the stats should be cached until fresh is requested
+    """
+    before = test_client.get('/shelf/stats?fresh=1').json['stats']
+
+    record = GOOD_RECORD_DATA.copy()
+    record.update(extension='stat', user=7070, size='2kb')
+    test_client.post('/shelf', json=record)
+    record.update(size='512')
+    test_client.post('/shelf/bulk', json=[record])
+
+    resp = test_client.get('/shelf/stats')
+    assert resp.status_code == 200
+    assert resp.json['stats'] == before
+
+    stats = test_client.get('/shelf/stats?fresh=1').json['stats']
+    assert stats['records'] == before['records'] + 2
+    assert stats['bytes'] == before['bytes'] + 2048 + 512
+    assert {'extension': 'stat', 'records': 2, 'unsized': 0,
+            'bytes': 2560} in stats['by_extension']
+    assert {'creation_user': 7070, 'records': 2, 'unsized': 0,
+            'bytes': 2560} in stats['by_creation_user']
+    assert sum(g['records'] for g in stats['by_record_type']) == \
+        stats['records']
+
+
+def test_backfill_size_bytes(test_client, with_collection):
+    """
+    GIVEN a card catalog service
+    WHEN records were shelved without size_bytes
+    WHEN backfill_size_bytes is run
+    THEN size_bytes should be filled in from size
+    """
+    collectionid = with_collection['collectionid']
+    assert with_collection['edition']['size_bytes'] == 101 * 1024
+
+    db.session.execute(db.update(Shelf).values(size_bytes=None))
+    db.session.commit()
+
+    assert backfill_size_bytes(batch_size=2) > 0
+    record = db.session.query(Shelf.size_bytes) \
+                       .filter(Shelf.collectionid == collectionid).scalar()
+    assert record == 101 * 1024
+    assert db.session.query(Shelf).filter(Shelf.size_bytes.is_(None)) \
+                     .count() == 0
+
+
+def test_search_collections(test_client):
+    """
+    GIVEN a card catalog service
+    WHEN collections with matching titles, authors and filenames exist
+    WHEN the GET /shelf/search?q= is invoked
+    THEN the response should be 200
+    THEN only the current editions of matching collections should be ranked
+    THEN the results should page with next_offset
+    """
+    ids = []
+    for i in range(3):
+        record = GOOD_RECORD_DATA.copy()
+        record['title'] = f'Quarterly zanzibar report {i}'
+        record['author'] = 'Searcher'
+        record['filename'] = f'zanzibar-{i}.docx'
+        resp = test_client.post('/shelf', json=record)
+        ids.append(resp.json['collectionid'])
+
+    # the first collection moves on to an edition that no longer matches
+    test_client.post(f'/shelf/{ids[0]}', json=GOOD_RECORD_DATA)
+
+    resp = test_client.get('/shelf/search?q=Zanzibar&limit=1')
+    assert resp.status_code == 200
+    assert resp.json['Ok']
+    assert len(resp.json['collections']) == 1
+    assert resp.json['next_offset'] == 1
+
+    resp = test_client.get('/shelf/search?q=zanzibar, searcher!&offset=1')
+    assert resp.json['next_offset'] is None
+    assert len(resp.json['collections']) == 1
+    found = {resp.json['collections'][0]['collectionid']}
+
+    resp = test_client.get('/shelf/search?q=zanzibar&limit=1')
+    found.add(resp.json['collections'][0]['collectionid'])
+    assert found == set(ids[1:])
+
+
+def test_search_collections_no_query(test_client):
+    """
+    GIVEN a card catalog service
+    WHEN the GET /shelf/search is invoked without a query
+    THEN Ok should be False
+    WHEN the query has no words
+    THEN no collections should be returned
+    """
+    resp = test_client.get('/shelf/search')
+    assert resp.json['Ok'] is False
+    assert resp.json['ErrMsg'] == 'A search query is required'
+
+    resp = test_client.get('/shelf/search?q=%22*')
+    assert resp.json['Ok']
+    assert resp.json['collections'] == []
+
+
+def test_get_checksum(test_client, with_collection):
+    """
+    GIVEN a card catalog service
+    WHEN a collection i has an edition with checksum c
+    WHEN the GET /shelf/checksum/{c} is invoked
+    THEN the response should be 200
+    THEN Ok should be True
+    THEN the collection and edition carrying c should be returned
+    """
+    collectionid = with_collection['collectionid']
+    new_edition = GOOD_RECORD_DATA.copy()
+    new_edition['checksum'] = 'checksum-single'
+    test_client.post(f'/shelf/{collectionid}', json=new_edition)
+
+    resp = test_client.get('/shelf/checksum/checksum-single')
+    assert resp.status_code == 200
+    assert resp.json['Ok']
+    assert resp.json['records'] == [{'collectionid': collectionid,
+                                     'edition': 2}]
+
+
+def test_get_checksum_unknown(test_client):
+    """
+    GIVEN a card catalog service
+    WHEN no record has checksum c
+    WHEN the GET /shelf/checksum/{c} is invoked
+    THEN the response should be 200
+    THEN Ok should be False
+    THEN the error message should be correct
+    """
+    resp = test_client.get('/shelf/checksum/checksum-unknown')
+    assert resp.status_code == 200
+    assert resp.json['Ok'] is False
+    assert resp.json['ErrMsg'] == 'Unknown checksum checksum-unknown'
+
+
+def test_lookup_checksums(test_client):
+    """
+    GIVEN a card catalog service
+    WHEN records with checksums a and b exist
+    WHEN the POST /shelf/checksum/lookup is invoked with a, b and c
+    THEN the response should be 200
+    THEN Ok should be True
+    THEN a and b should be found and c should be missing
+    """
+    records = []
+    for checksum in ['checksum-a', 'checksum-b']:
+        record = GOOD_RECORD_DATA.copy()
+        record['checksum'] = checksum
+        records.append(record)
+    results = test_client.post('/shelf/bulk', json=records).json['results']
+
+    resp = test_client.post('/shelf/checksum/lookup', json={
+        'checksums': ['checksum-a', 'checksum-b', 'checksum-c']
+    })
+    assert resp.status_code == 200
+    assert resp.json['Ok']
+    assert resp.json['found'] == {
+        'checksum-a': [{'collectionid': results[0]['collectionid'],
+                        'edition': 1}],
+        'checksum-b': [{'collectionid': results[1]['collectionid'],
+                        'edition': 1}]
+    }
+    assert resp.json['missing'] == ['checksum-c']
+
+
+def test_lookup_checksums_bad_data(test_client):
+    """
+    GIVEN a card catalog service
+    WHEN the POST /shelf/checksum/lookup is invoked without a list
+    THEN the response should be 200
+    THEN Ok should be False
+    """
+    resp = test_client.post('/shelf/checksum/lookup',
+                            json={'checksums': 'checksum-a'})
+    assert resp.status_code == 200
+    assert resp.json['Ok'] is False
+
+
 def test_get_specific_edition(test_client, with_collection):
     """
     GIVEN a card catalog service
@@ -316,7 +1211,7 @@ def test_get_specific_edition_random(test_client, with_collection):
         new_edition['title'] = new_title
         resp = test_client.post(f'/shelf/{collectionid}', json=new_edition)
 
-    specific_edition = random.randint(3, 10)
+    specific_edition = random.randint(1, edition_count - 1)
 
     resp = test_client.get(f'/shelf/{collectionid}/edition/{specific_edition}')
     assert resp.status_code == 200
@@ -362,11 +1257,28 @@ def test_get_specific_edition_bad_edition(test_client, with_collection):
     assert resp.status_code == 200
     assert resp.json['Ok'] is False
     assert resp.json['ErrMsg'] == f"Unknown edition {editionid}"
+    assert resp.json['Count'] == with_collection['current_edition']
 
 
 #####################
 # Method Unit Tests #
 #####################
+def test_parse_size():
+    """
+    GIVEN record sizes as numbers and strings
+    WHEN parse_size is called
+    THEN the number of bytes should be returned or None if unreadable
+    """
+    assert parse_size(42) == 42
+    assert parse_size('2048') == 2048
+    assert parse_size('101kb') == 101 * 1024
+    assert parse_size('1.5 MiB') == 1536 * 1024
+    assert parse_size('3G') == 3 * 1024 ** 3
+    assert parse_size('big') is None
+    assert parse_size(None) is None
+    assert parse_size(True) is None
+
+
 def test_validate_record_data_good():
     """
     GIVEN
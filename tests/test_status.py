@@ -26,6 +26,7 @@ import pytest
 from app.appfactory import create_app
 from app.version import VERSION, APPNAME
 from app.models.dbbase import db
+from app.models import CardCatalog
 from .config import TestConfig
 
 
@@ -119,4 +120,29 @@ def test_status_good(test_client, init_db):
     assert resp.json['database']['applicationName'] == APPNAME
     assert resp.json['database']['version'] == VERSION
 
+
+def test_status_cached(test_client, init_db):
+    """
+    GIVEN a card catalog service
+    WHEN the GET /status page has been requested
+    WHEN the database changes afterwards
+    THEN should return the cached status
+    WHEN the GET /status?fresh=1 page is requested
+    THEN should return the current status
+    """
+    test_client.post('/init')
+    resp = test_client.get('/status')
+    assert resp.json['database']['status'] == 'Initialized'
+
+    CardCatalog.query.delete()
+    db.session.commit()
+
+    resp = test_client.get('/status')
+    assert resp.status_code == 200
+    assert resp.json['database']['status'] == 'Initialized'
+
+    resp = test_client.get('/status?fresh=1')
+    assert resp.status_code == 200
+    assert resp.json['database']['status'] == 'Uninitialized'
+
 # }}}
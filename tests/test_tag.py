@@ -22,8 +22,12 @@ tag unit tests
 
 # test_tag {{{
 
+import time
 import pytest
+from sqlalchemy import event
 from app.appfactory import create_app
+from app.models import db, Collection, Tag
+from app.models.tags import collectionXtag
 from .config import TestConfig
 
 A_TAG_NAME = 'ANewTag'
@@ -73,7 +77,7 @@ def test_add_tag(test_client):
     print(resp.json)
     assert resp.status_code == 200
     assert resp.json['Ok']
-    assert resp.json.has_key('tagId')
+    assert 'tagId' in resp.json
 
 
 def test_add_tag_already_exists(test_client, with_tag):
@@ -108,4 +112,289 @@ def test_add_tag_tag_name_missing(test_client):
     assert resp.status_code == 200
     assert resp.json['Ok'] is False
     assert resp.json['ErrMsg'] == "Tag Name is missing from the request"
+
+
+@pytest.mark.parametrize('tagName, errMsg', [
+    (5, 'Tag Name must be a non empty string'),
+    ('', 'Tag Name must be a non empty string'),
+    ('  ', 'Tag Name must be a non empty string'),
+    ('1234', 'Tag Name can not be a number'),
+    (' Padded ', 'Tag Name can not start or end with whitespace'),
+    ('a/b', "Tag Name can not contain '/'"),
+])
+def test_add_tag_tag_name_invalid(test_client, tagName, errMsg):
+    """
+    GIVEN a card catalog microserve
+    WHEN POST /tag is invoked
+    WHEN the tag name is not a string, empty or all digits
+    THEN the response should be 200
+    THEN Ok should be False
+    THEN ErrMsg should be correct
+    THEN the tag should not be created
+    """
+    count = Tag.query.count()
+    resp = test_client.post('/tag', json={'tagName': tagName})
+    assert resp.status_code == 200
+    assert resp.json['Ok'] is False
+    assert resp.json['ErrMsg'] == errMsg
+    assert Tag.query.count() == count
+
+
+def test_get_tag(test_client, with_tag):
+    """
+    GIVEN a card catalog microserve
+    WHEN a tag exists
+    WHEN GET /tag/{id} or GET /tag/{name} is invoked
+    THEN the response should be 200
+    THEN Ok should be True
+    THEN the tag should be returned
+    """
+    assert with_tag
+    resp = test_client.get(f'/tag/{A_TAG_NAME}')
+    assert resp.status_code == 200
+    assert resp.json['Ok']
+    assert resp.json['tag']['name'] == A_TAG_NAME
+
+    tagid = resp.json['tag']['tagid']
+    resp = test_client.get(f'/tag/{tagid}')
+    assert resp.status_code == 200
+    assert resp.json['Ok']
+    assert resp.json['tag'] == {'tagid': tagid, 'name': A_TAG_NAME}
+
+
+def test_get_tag_unknown(test_client):
+    """
+    GIVEN a card catalog microserve
+    WHEN GET /tag/{name} is invoked
+    WHEN the tag does not exist
+    THEN the response should be 200
+    THEN Ok should be False
+    THEN ErrMsg should be correct
+    """
+    resp = test_client.get('/tag/NoSuchTag')
+    assert resp.status_code == 200
+    assert resp.json['Ok'] is False
+    assert resp.json['ErrMsg'] == "Unknown tag NoSuchTag"
+
+
+def test_tag_cache(test_client):
+    """
+    GIVEN a card catalog microserve
+    WHEN a tag has been looked up
+    WHEN it is looked up again
+    THEN the lookup should be a cache hit reported on /status
+    WHEN the tag is renamed
+    THEN the old name should no longer resolve
+    THEN the new name should resolve
+    WHEN the tag is deleted
+    THEN neither the name nor the id should resolve
+    """
+    tagid = test_client.post('/tag', json={'tagName': 'CachedTag'}) \
+                       .json['tagId']
+    test_client.get('/tag/CachedTag')
+    hits = test_client.get('/status').json['tagCache']['hits']
+    resp = test_client.get('/tag/CachedTag')
+    assert resp.json['tag']['tagid'] == tagid
+    assert test_client.get('/status').json['tagCache']['hits'] == hits + 1
+
+    resp = test_client.put('/tag/CachedTag', json={'tagName': 'RenamedTag'})
+    assert resp.json['Ok']
+    assert resp.json['tag'] == {'tagid': tagid, 'name': 'RenamedTag'}
+    assert test_client.get('/tag/CachedTag').json['Ok'] is False
+    assert test_client.get(f'/tag/{tagid}').json['tag']['name'] == \
+        'RenamedTag'
+
+    resp = test_client.delete(f'/tag/{tagid}')
+    assert resp.json['Ok']
+    assert test_client.get('/tag/RenamedTag').json['Ok'] is False
+    assert test_client.get(f'/tag/{tagid}').json['Ok'] is False
+
+
+def test_tag_cache_ttl(test_client, monkeypatch):
+    """
+    GIVEN a card catalog microserve
+    WHEN a tag is renamed outside of this process
+    THEN the cached name should be served until the entry expires
+    THEN the new name should be read once it has expired
+    """
+    tagid = test_client.post('/tag', json={'tagName': 'ExpiringTag'}) \
+                       .json['tagId']
+    test_client.get(f'/tag/{tagid}')
+    db.session.execute(Tag.__table__.update()
+                       .where(Tag.__table__.c.tagid == tagid)
+                       .values(name='ExpiredTag'))
+    db.session.commit()
+    assert test_client.get(f'/tag/{tagid}').json['tag']['name'] == \
+        'ExpiringTag'
+
+    ttl = test_client.get('/status').json['tagCache']['ttl']
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + ttl + 1)
+    assert test_client.get(f'/tag/{tagid}').json['tag']['name'] == \
+        'ExpiredTag'
+
+
+def test_update_tag_already_exists(test_client, with_tag):
+    """
+    GIVEN a card catalog microserve
+    WHEN two tags exist
+    WHEN PUT /tag/{name} renames one to the other
+    THEN the response should be 200
+    THEN Ok should be False
+    THEN ErrMsg should be correct
+    """
+    assert with_tag
+    test_client.post('/tag', json={'tagName': 'OtherTag'})
+    resp = test_client.put('/tag/OtherTag', json=A_TAG_DATA)
+    assert resp.status_code == 200
+    assert resp.json['Ok'] is False
+    assert resp.json['ErrMsg'] == f"Tag {A_TAG_NAME} already exists"
+    assert test_client.get('/tag/OtherTag').json['Ok']
+
+
+def test_tag_collections(test_client, monkeypatch):
+    """
+    GIVEN a card catalog microserve
+    WHEN a tag and several collections exist
+    WHEN POST /tag/{id}/collections is invoked with repeated and unknown ids
+    THEN each collection should be tagged once across chunks
+    THEN the unknown ids should be reported missing
+    WHEN DELETE /tag/{id}/collections is invoked
+    THEN the tag should be removed from those collections only
+    """
+    monkeypatch.setitem(test_client.application.config,
+                        'TAG_ASSIGN_CHUNK_SIZE', 2)
+    tagid = test_client.post('/tag', json={'tagName': 'BulkTag'}) \
+                       .json['tagId']
+    record = {'record_type': 1, 'title': 'Bulk', 'filename': 'bulk.txt',
+              'extension': 'txt', 'size': '1', 'checksum': 'bulk',
+              'author': 'Me', 'user': 1000}
+    ids = test_client.post('/shelf/bulk', json=[record] * 3).json['results']
+    ids = [result['collectionid'] for result in ids]
+
+    resp = test_client.post(f'/tag/{tagid}/collections',
+                            json={'ids': [ids[0], ids[1], ids[0], 99999]})
+    assert resp.json['Ok']
+    assert resp.json['added'] == 2
+    assert resp.json['missing'] == [99999]
+
+    resp = test_client.post(f'/tag/{tagid}/collections', json={'ids': ids})
+    assert resp.json['added'] == 1
+
+    resp = test_client.get('/shelf?tag=BulkTag')
+    assert [c['collectionid'] for c in resp.json['collections']] == ids
+
+    resp = test_client.delete(f'/tag/{tagid}/collections',
+                              json={'ids': ids[:2]})
+    assert resp.json['Ok']
+    assert resp.json['removed'] == 2
+    resp = test_client.get('/shelf?tag=BulkTag')
+    assert [c['collectionid'] for c in resp.json['collections']] == ids[2:]
+
+
+def test_delete_tag_statements(test_client):
+    """
+    GIVEN a card catalog microserve
+    WHEN a tag is attached to many collections
+    WHEN DELETE /tag/{id} is invoked
+    THEN the tag and its collectionXTag rows should be deleted with one
+         statement each without loading the collections
+    """
+    tagid = test_client.post('/tag', json={'tagName': 'WideTag'}) \
+                       .json['tagId']
+    record = {'record_type': 1, 'title': 'Wide', 'filename': 'wide.txt',
+              'extension': 'txt', 'size': '1', 'checksum': 'wide',
+              'author': 'Me', 'user': 1000}
+    ids = test_client.post('/shelf/bulk', json=[record] * 20).json['results']
+    ids = [result['collectionid'] for result in ids]
+    test_client.post(f'/tag/{tagid}/collections', json={'ids': ids})
+    statements = []
+
+    def record_statement(conn, cursor, statement, parameters, context,  # pylint: disable=too-many-arguments
+                         executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record_statement)
+    try:
+        resp = test_client.delete(f'/tag/{tagid}')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record_statement)
+
+    assert resp.json['Ok']
+    assert len([s for s in statements if s.startswith('DELETE')]) == 2
+    assert not [s for s in statements
+                if s.startswith('SELECT') and 'collection' in s]
+    assert db.session.query(collectionXtag) \
+                     .filter(collectionXtag.c.tagid == tagid).count() == 0
+    assert test_client.get(f'/tag/{tagid}').json['Ok'] is False
+
+
+def test_tag_collections_bad_request(test_client):
+    """
+    GIVEN a card catalog microserve
+    WHEN POST /tag/{id}/collections is invoked for an unknown tag
+    WHEN it is invoked without a list of integer ids
+    THEN Ok should be False
+    """
+    resp = test_client.post('/tag/99999/collections', json={'ids': [1]})
+    assert resp.json['Ok'] is False
+    assert resp.json['ErrMsg'] == 'Unknown tag 99999'
+
+    tagid = test_client.post('/tag', json={'tagName': 'BadBulkTag'}) \
+                       .json['tagId']
+    resp = test_client.delete(f'/tag/{tagid}/collections',
+                              json={'ids': '1,2'})
+    assert resp.json['Ok'] is False
+    assert resp.json['ErrMsg'] == 'ids must be a list of integers'
+
+
+def test_tag_collection_counts(test_client):
+    """
+    GIVEN a card catalog microserve
+    WHEN tags are added to and removed from collections in bulk and through
+         the Collection.tags relationship
+    THEN each tag should keep count of its collections
+    WHEN GET /tag is invoked
+    THEN the tags should be listed most used first, page by page
+    """
+    tagids = [test_client.post('/tag', json={'tagName': f'Count{i}'})
+                         .json['tagId'] for i in range(3)]
+    record = {'record_type': 1, 'title': 'Counted', 'filename': 'count.txt',
+              'extension': 'txt', 'size': '1', 'checksum': 'count',
+              'author': 'Me', 'user': 1000}
+    ids = [result['collectionid'] for result in
+           test_client.post('/shelf/bulk', json=[record] * 4)
+                      .json['results']]
+
+    test_client.post(f'/tag/{tagids[0]}/collections', json={'ids': ids})
+    test_client.delete(f'/tag/{tagids[0]}/collections',
+                       json={'ids': ids[:1]})
+    test_client.post(f'/tag/{tagids[1]}/collections', json={'ids': ids[:2]})
+
+    tags = [db.session.get(Tag, tagid) for tagid in tagids]
+    collections = [db.session.get(Collection, i) for i in ids]
+    collections[0].tags.append(tags[2])
+    collections[1].tags.append(tags[1])
+    tags[2].collection.append(collections[1])
+    db.session.commit()
+    collections[0].tags.remove(tags[1])
+    db.session.commit()
+
+    counts = {tagid: db.session.query(collectionXtag)
+                               .filter_by(tagid=tagid).count()
+              for tagid in tagids}
+    assert counts == {tagids[0]: 3, tagids[1]: 1, tagids[2]: 2}
+    for tag in tags:
+        db.session.refresh(tag)
+        assert tag.collection_count == counts[tag.tagid]
+
+    resp = test_client.get('/tag?limit=2')
+    assert resp.json['Ok']
+    assert [t['tagid'] for t in resp.json['tags']] == [tagids[0], tagids[2]]
+    assert resp.json['tags'][0] == {'tagid': tagids[0], 'name': 'Count0',
+                                    'collection_count': 3}
+    resp = test_client.get('/tag?limit=2'
+                           f'&after_count={resp.json["next_after_count"]}'
+                           f'&after_tagid={resp.json["next_after_tagid"]}')
+    assert resp.json['tags'][0]['tagid'] == tagids[1]
 # }}}